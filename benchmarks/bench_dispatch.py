@@ -0,0 +1,386 @@
+"""
+Microbenchmarks for the pyeventsystem dispatcher.
+
+Run all benchmarks from the repository root, with pyeventsystem installed
+(e.g. `pip install -e .`), and write the results as JSON:
+
+    python benchmarks/bench_dispatch.py -o results.json
+
+Compare the results of two runs:
+
+    python benchmarks/bench_dispatch.py --compare before.json after.json
+
+Only benchmarks whose name contains one of the values passed to --filter are
+run, e.g. `--filter dispatch.observe --filter churn`.
+"""
+import argparse
+import json
+import logging
+import platform
+import statistics
+import sys
+import time
+
+from pyeventsystem import __version__
+from pyeventsystem.events import SimpleEventDispatcher
+from pyeventsystem.middleware import SimpleMiddlewareManager
+from pyeventsystem.middleware import dispatch
+
+EVENT_NAME = "provider.compute.instances.list"
+
+BENCHMARKS = []
+
+
+def benchmark(name):
+    """
+    Registers a benchmark. The decorated function performs any setup and
+    returns a function which executes the benchmarked operation `loops`
+    times.
+    """
+    def deco(f):
+        BENCHMARKS.append((name, f))
+        return f
+    return deco
+
+
+def _observer(event_args, *args, **kwargs):
+    pass
+
+
+def _interceptor(event_args, *args, **kwargs):
+    next_handler = event_args['next_handler']
+    if next_handler:
+        return next_handler.invoke(event_args, *args, **kwargs)
+    return None
+
+
+def _implementer(*args, **kwargs):
+    return args
+
+
+def _chain_benchmark(subscribe, length, compile_threshold=None):
+    def setup():
+        dispatcher = SimpleEventDispatcher(
+            compile_threshold=compile_threshold)
+        for priority in range(length):
+            subscribe(dispatcher, priority)
+        dispatcher.dispatch(None, EVENT_NAME, 1, key='value')
+
+        def run(loops):
+            dispatch_event = dispatcher.dispatch
+            for _ in range(loops):
+                dispatch_event(None, EVENT_NAME, 1, key='value')
+        return run
+    return setup
+
+
+for _length in (1, 10, 100):
+    benchmark("dispatch.observe[{0}]".format(_length))(_chain_benchmark(
+        lambda d, p: d.observe(EVENT_NAME, p, _observer), _length))
+    benchmark("dispatch.intercept[{0}]".format(_length))(_chain_benchmark(
+        lambda d, p: d.intercept(EVENT_NAME, p, _interceptor), _length))
+    benchmark("dispatch.implement[{0}]".format(_length))(_chain_benchmark(
+        lambda d, p: d.implement(EVENT_NAME, p, _implementer), _length))
+
+
+def _mixed_chain(dispatcher, priority):
+    if priority % 10 == 0:
+        dispatcher.intercept(EVENT_NAME, priority, _interceptor)
+    elif priority % 10 == 5:
+        dispatcher.implement(EVENT_NAME, priority, _implementer)
+    else:
+        dispatcher.observe(EVENT_NAME, priority, _observer)
+
+
+for _length in (10, 100):
+    benchmark("dispatch.mixed[{0}]".format(_length))(
+        _chain_benchmark(_mixed_chain, _length))
+
+for _length in (1, 10, 100):
+    benchmark("dispatch.compiled.observe[{0}]".format(_length))(
+        _chain_benchmark(lambda d, p: d.observe(EVENT_NAME, p, _observer),
+                         _length, compile_threshold=1))
+    benchmark("dispatch.compiled.implement[{0}]".format(_length))(
+        _chain_benchmark(lambda d, p: d.implement(EVENT_NAME, p, _implementer),
+                         _length, compile_threshold=1))
+
+for _length in (10, 100):
+    benchmark("dispatch.compiled.mixed[{0}]".format(_length))(
+        _chain_benchmark(_mixed_chain, _length, compile_threshold=1))
+
+
+def _filtering_observer(event_args, *args, **kwargs):
+    if kwargs.get('key') != 'other':
+        return
+
+
+# Observers which all skip the dispatched arguments or sender, filtered in the
+# callback itself, or declaratively
+for _length in (10, 100):
+    benchmark("dispatch.filtered.callback[{0}]".format(_length))(
+        _chain_benchmark(
+            lambda d, p: d.observe(EVENT_NAME, p, _filtering_observer),
+            _length))
+    benchmark("dispatch.filtered.match[{0}]".format(_length))(
+        _chain_benchmark(
+            lambda d, p: d.observe(EVENT_NAME, p, _observer,
+                                   match={'key': 'other'}),
+            _length))
+    benchmark("dispatch.filtered.sender_type[{0}]".format(_length))(
+        _chain_benchmark(
+            lambda d, p: d.observe(EVENT_NAME, p, _observer,
+                                   sender_type=int),
+            _length))
+    benchmark("dispatch.compiled.filtered.match[{0}]".format(_length))(
+        _chain_benchmark(
+            lambda d, p: d.observe(EVENT_NAME, p, _observer,
+                                   match={'key': 'other'}),
+            _length, compile_threshold=1))
+
+
+def _unhandled_benchmark(policy):
+    def setup():
+        dispatcher = SimpleEventDispatcher(unhandled_policy=policy)
+        dispatcher.observe("some.other.event", 1000, _observer)
+
+        def run(loops):
+            for _ in range(loops):
+                dispatcher.dispatch(None, EVENT_NAME)
+        return run
+    return setup
+
+
+for _policy in (SimpleEventDispatcher.WARN, SimpleEventDispatcher.RATE_LIMIT,
+                SimpleEventDispatcher.IGNORE):
+    benchmark("dispatch.unhandled[{0}]".format(_policy))(
+        _unhandled_benchmark(_policy))
+
+
+def _cache_miss_benchmark(pattern_count, literal_only=False):
+    def setup():
+        dispatcher = SimpleEventDispatcher(cache_size=None)
+        for i in range(pattern_count):
+            # A mix of trailing wildcards, inner wildcards and literal names
+            if literal_only:
+                pattern = "provider.service{0}.resource.list".format(i)
+            elif i % 3 == 0:
+                pattern = "provider.service{0}.*".format(i)
+            elif i % 3 == 1:
+                pattern = "provider.*.resource{0}.list".format(i)
+            else:
+                pattern = "provider.service{0}.resource.list".format(i)
+            dispatcher.observe(pattern, i, _observer)
+        counter = [0]
+
+        def run(loops):
+            start = counter[0]
+            counter[0] += loops
+            get_chain = dispatcher.get_chain_for_event
+            # every event name is new, so each lookup is a cache miss
+            for i in range(start, start + loops):
+                get_chain("provider.service{0}.resource.list".format(i))
+        return run
+    return setup
+
+
+for _count in (10, 100, 1000):
+    benchmark("cache_miss[{0} patterns]".format(_count))(
+        _cache_miss_benchmark(_count))
+    benchmark("cache_miss.literal[{0} patterns]".format(_count))(
+        _cache_miss_benchmark(_count, literal_only=True))
+
+
+def _churn_benchmark(cached_events):
+    def setup():
+        dispatcher = SimpleEventDispatcher(cache_size=None)
+        for i in range(cached_events):
+            dispatcher.get_chain_for_event(
+                "provider.service{0}.resource.list".format(i))
+        dispatcher.observe("provider.*", 0, _observer)
+
+        def run(loops):
+            for _ in range(loops):
+                handler = dispatcher.observe("provider.*", 1, _observer)
+                handler.unsubscribe()
+        return run
+    return setup
+
+
+for _count in (10, 1000):
+    benchmark("churn.subscribe_unsubscribe[{0} cached]".format(_count))(
+        _churn_benchmark(_count))
+
+
+def _bucket_churn_benchmark(handler_count):
+    def setup():
+        dispatcher = SimpleEventDispatcher()
+        for i in range(handler_count):
+            dispatcher.observe(EVENT_NAME, i * 2, _observer)
+        dispatcher.observe("provider.*", -1, _observer)
+
+        def run(loops):
+            # churn a handler in the middle of a large chain, and rebuild it
+            for _ in range(loops):
+                handler = dispatcher.observe(EVENT_NAME, handler_count + 1,
+                                             _observer)
+                dispatcher.get_chain_for_event(EVENT_NAME)
+                handler.unsubscribe()
+        return run
+    return setup
+
+
+for _count in (10, 1000):
+    benchmark("churn.rebuild_chain[{0} handlers]".format(_count))(
+        _bucket_churn_benchmark(_count))
+
+
+class _Service(object):
+
+    def __init__(self, manager):
+        self.events = manager.events
+
+    @dispatch(EVENT_NAME, priority=2500)
+    def decorated(self, *args, **kwargs):
+        return args
+
+    def plain(self, *args, **kwargs):
+        return args
+
+
+@benchmark("decorator.plain_call")
+def bench_plain_call():
+    service = _Service(SimpleMiddlewareManager())
+
+    def run(loops):
+        for _ in range(loops):
+            service.plain(1, key='value')
+    return run
+
+
+@benchmark("decorator.dispatch_call")
+def bench_dispatch_call():
+    manager = SimpleMiddlewareManager()
+    service = _Service(manager)
+    manager.add(service)
+
+    def run(loops):
+        for _ in range(loops):
+            service.decorated(1, key='value')
+    return run
+
+
+@benchmark("decorator.unregistered_call")
+def bench_unregistered_call():
+    service = _Service(SimpleMiddlewareManager())
+
+    def run(loops):
+        for _ in range(loops):
+            service.decorated(1, key='value')
+    return run
+
+
+@benchmark("middleware.add_remove")
+def bench_middleware_add_remove():
+    manager = SimpleMiddlewareManager()
+
+    def run(loops):
+        for _ in range(loops):
+            # A new, short lived object each time
+            middleware = manager.add(_Service(manager))
+            manager.remove(middleware)
+    return run
+
+
+def _time(run, loops):
+    start = time.perf_counter()
+    run(loops)
+    return time.perf_counter() - start
+
+
+def measure(setup, min_time, repeat):
+    run = setup()
+    # calibrate the number of loops so that each sample takes min_time
+    loops = 1
+    while _time(run, loops) < min_time:
+        loops *= 10
+    # samples are in nanoseconds per operation
+    values = [_time(run, loops) * 1e9 / loops for _ in range(repeat)]
+    return {
+        'loops': loops,
+        'values': values,
+        'min': min(values),
+        'median': statistics.median(values),
+        'mean': statistics.mean(values),
+        'stdev': statistics.stdev(values) if len(values) > 1 else 0.0,
+    }
+
+
+def run_benchmarks(filters, min_time, repeat):
+    results = {}
+    for name, setup in BENCHMARKS:
+        if filters and not any(f in name for f in filters):
+            continue
+        results[name] = measure(setup, min_time, repeat)
+        print("{0:<45} {1:>12.1f} ns".format(name, results[name]['median']),
+              file=sys.stderr)
+    return {
+        'metadata': {
+            'pyeventsystem': __version__,
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'timestamp': time.time(),
+        },
+        'benchmarks': results,
+    }
+
+
+def compare(before_file, after_file):
+    with open(before_file) as f:
+        before = json.load(f)['benchmarks']
+    with open(after_file) as f:
+        after = json.load(f)['benchmarks']
+    print("{0:<45} {1:>12} {2:>12} {3:>8}".format(
+        "benchmark", "before (ns)", "after (ns)", "change"))
+    for name in sorted(set(before) & set(after)):
+        old = before[name]['median']
+        new = after[name]['median']
+        print("{0:<45} {1:>12.1f} {2:>12.1f} {3:>7.2f}x".format(
+            name, old, new, old / new if new else float('inf')))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split(
+        "\n")[0])
+    parser.add_argument("-o", "--output",
+                        help="File to write the JSON results to. Defaults to"
+                             " stdout.")
+    parser.add_argument("-f", "--filter", action="append", default=[],
+                        help="Only run benchmarks containing this string.")
+    parser.add_argument("-r", "--repeat", type=int, default=5,
+                        help="Number of samples per benchmark.")
+    parser.add_argument("--min-time", type=float, default=0.1,
+                        help="Minimum duration of each sample in seconds.")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"),
+                        help="Compare two previously written result files.")
+    args = parser.parse_args(argv)
+
+    # Unhandled events are logged. Keep the cost of logging in the results,
+    # but don't print the messages.
+    logger = logging.getLogger('pyeventsystem')
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    results = run_benchmarks(args.filter, args.min_time, args.repeat)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import asyncio
+import inspect
+from time import perf_counter as _clock
+
+from .events import BATCH_OBSERVE
+from .events import HandlerLink
+from .events import IMPLEMENT
+from .events import INTERCEPT
+from .events import OBSERVE
+from .events import ObservingEventHandler
+from .events import SimpleEventDispatcher
+from .events import _matches
+from .events import _stream_result
+
+
+async def _resolve(value):
+    if inspect.isawaitable(value):
+        return await value
+    return value
+
+
+class ConcurrentObservingEventHandler(ObservingEventHandler):
+    """
+    An observing handler whose callback may be run concurrently with the
+    callbacks of adjacent concurrent observers in the same chain. Use this
+    for observers whose relative ordering does not matter. Dispatchers that
+    are not asyncio based treat it like any other observing handler.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, event_pattern, priority, callback, sender_type=None,
+                 match=None):
+        super(ConcurrentObservingEventHandler, self).__init__(
+            event_pattern, priority, callback, sender_type=sender_type,
+            match=match)
+
+
+class AsyncHandlerLink(HandlerLink):
+    """
+    A link in the handler chain of an AsyncEventDispatcher. Invoking the link
+    returns a coroutine, which awaits the callback of the handler and the
+    remainder of the chain.
+    """
+
+    __slots__ = ()
+
+    async def invoke(self, event_args, *args, **kwargs):
+        match = self.match
+        if match is not None and not _matches(match, kwargs):
+            if self.next:
+                return await self.next.invoke(event_args, *args, **kwargs)
+            return None
+        handler = self.handler
+        kind = self.kind
+        if isinstance(handler, ConcurrentObservingEventHandler):
+            return await self._invoke_concurrent_observers(
+                event_args, *args, **kwargs)
+        monitor = self.monitor
+        if monitor is not None:
+            token = monitor.start(event_args.get('event'), handler)
+        result = None
+        next_link = None
+        try:
+            if kind is OBSERVE or kind is BATCH_OBSERVE:
+                # Observers shouldn't pass a next_handler
+                event_args.pop('next_handler', None)
+                # Notify listener. Ignore result from observable handler
+                if kind is OBSERVE:
+                    await _resolve(
+                        handler.callback(event_args, *args, **kwargs))
+                else:
+                    await _resolve(
+                        handler.callback(event_args, [(args, kwargs)]))
+                next_link = self.next
+            elif kind is INTERCEPT:
+                event_args['next_handler'] = self.next
+                # callback is responsible for awaiting the next_handler and
+                # controlling the result value
+                result = await _resolve(
+                    handler.callback(event_args, *args, **kwargs))
+                event_args.pop('next_handler', None)
+            elif kind is IMPLEMENT:
+                result = await _resolve(handler.callback(*args, **kwargs))
+                if self.stream:
+                    result = _stream_result(result)
+                next_link = self.next
+            else:
+                # Handlers that don't derive from BaseEventHandler are
+                # responsible for invoking the remainder of the chain
+                result = await _resolve(
+                    handler.invoke(event_args, *args, **kwargs))
+        except Exception:
+            if monitor is not None:
+                monitor.finish(event_args.get('event'), handler, token, True)
+            raise
+        if monitor is not None:
+            monitor.finish(event_args.get('event'), handler, token)
+        if not next_link:
+            return result
+        if kind is IMPLEMENT:
+            event_args['next_handler'] = next_link
+            event_args['result'] = result
+            await next_link.invoke(event_args, *args, **kwargs)
+            event_args.pop('result', None)
+            event_args.pop('next_handler', None)
+            return result
+        return await next_link.invoke(event_args, *args, **kwargs)
+
+    async def _invoke_concurrent_observers(self, event_args, *args, **kwargs):
+        event_args.pop('next_handler', None)
+        monitor = self.monitor
+        if monitor is not None:
+            start = _clock()
+        handlers = []
+        pending = []
+        link = self
+        while link and isinstance(link.handler,
+                                  ConcurrentObservingEventHandler):
+            if link.match is not None and not _matches(link.match, kwargs):
+                link = link.next
+                continue
+            handlers.append(link.handler)
+            result = link.handler.callback(event_args, *args, **kwargs)
+            if inspect.isawaitable(result):
+                pending.append(result)
+            link = link.next
+        if pending:
+            # Each handler in the group is recorded with the latency of the
+            # whole group, since they run concurrently
+            try:
+                await asyncio.gather(*pending)
+            except Exception:
+                if monitor is not None:
+                    self._record_group(monitor, event_args, handlers, start,
+                                       True)
+                raise
+        if monitor is not None:
+            self._record_group(monitor, event_args, handlers, start, False)
+        if link:
+            return await link.invoke(event_args, *args, **kwargs)
+        return None
+
+    @staticmethod
+    def _record_group(monitor, event_args, handlers, start, failed):
+        elapsed = _clock() - start
+        for handler in handlers:
+            monitor.record(event_args.get('event'), handler, elapsed, failed)
+
+
+class AsyncEventDispatcher(SimpleEventDispatcher):
+    """
+    An event dispatcher for asyncio applications. Handlers are subscribed in
+    exactly the same way as with a SimpleEventDispatcher, including through
+    middleware, but `dispatch` is a coroutine, and any awaitable returned by
+    a callback is awaited before moving along the chain. Intercepting
+    handlers must therefore await `next_handler.invoke(...)`.
+    """
+
+    link_class = AsyncHandlerLink
+
+    def observe(self, event_pattern, priority, callback, concurrent=False,
+                sender_type=None, match=None):
+        """
+        Observe an event. If `concurrent` is True, the callback is run
+        concurrently, through asyncio.gather, with any concurrent observers
+        that directly precede or follow it in the handler chain.
+        """
+        if concurrent:
+            handler = ConcurrentObservingEventHandler(
+                event_pattern, priority, callback, sender_type, match)
+            self.subscribe(handler)
+            return handler
+        return super(AsyncEventDispatcher, self).observe(
+            event_pattern, priority, callback, sender_type=sender_type,
+            match=match)
+
+    async def dispatch(self, sender, event, *args, **kwargs):
+        chain = self.get_chain_for_event(event)
+
+        if chain:
+            if chain.sender_filtered:
+                chain = chain.for_sender_type(type(sender))
+                if not chain:
+                    return None
+            monitor = chain.monitor
+            if monitor is None:
+                # only kick off first handler in chain
+                event_args = {'event': event, 'sender': sender}
+                return await chain.head.invoke(event_args, *args, **kwargs)
+            token = monitor.start(event, None)
+            try:
+                event_args = {'event': event, 'sender': sender}
+                result = await chain.head.invoke(event_args, *args, **kwargs)
+            except Exception:
+                monitor.finish(event, None, token, True)
+                raise
+            monitor.finish(event, None, token)
+            return result
+        else:
+            self._handle_unhandled_event(event)
+            return None
+
+    async def dispatch_many(self, sender, event, iterable_of_args, **kwargs):
+        """
+        Dispatches an event once for each item in iterable_of_args, in
+        sequence, and returns the list of results. See
+        SimpleEventDispatcher.dispatch_many.
+        """
+        chain = self.get_chain_for_event(event)
+        if not chain:
+            self._handle_unhandled_event(event)
+            return [None for _ in iterable_of_args]
+        if chain.sender_filtered:
+            chain = chain.for_sender_type(type(sender))
+        head, batch_observers = chain.split_batch_observers()
+        batch = []
+        results = []
+        for item in iterable_of_args:
+            args = item if isinstance(item, tuple) else (item,)
+            if head:
+                event_args = {'event': event, 'sender': sender}
+                results.append(
+                    await head.invoke(event_args, *args, **kwargs))
+            else:
+                results.append(None)
+            batch.append((args, kwargs))
+        if batch_observers:
+            event_args = {'event': event, 'sender': sender,
+                          'results': results}
+            for handler in batch_observers:
+                if handler.match and not _matches(handler.match.items(),
+                                                  kwargs):
+                    continue
+                await _resolve(handler.callback(event_args, batch))
+        return results
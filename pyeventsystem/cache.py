@@ -0,0 +1,80 @@
+from collections import OrderedDict
+from collections import namedtuple
+
+
+CacheInfo = namedtuple('CacheInfo',
+                       ['hits', 'misses', 'evictions', 'maxsize', 'currsize'])
+
+
+class LRUCache(object):
+    """
+    A dict like cache holding at most `maxsize` entries, which evicts the
+    least recently used entry when full. A `maxsize` of None makes the cache
+    unbounded. Hit, miss and eviction counts are tracked, and can be
+    retrieved through `info()`.
+
+    `get` may be called concurrently with other operations without locking,
+    although the counters are then approximate. All other operations must
+    be serialized by the caller.
+    """
+
+    def __init__(self, maxsize=None):
+        if maxsize is not None and maxsize < 1:
+            raise ValueError("Cache maxsize must be at least 1, or None for"
+                             " an unbounded cache.")
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        try:
+            self._data.move_to_end(key)
+        except KeyError:
+            # The key was concurrently removed after it was read
+            pass
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """
+        Adds a value to the cache, and returns the evicted (key, value) pair
+        if the cache was full, or None otherwise.
+        """
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if self.maxsize is not None and len(self._data) > self.maxsize:
+            self.evictions += 1
+            return self._data.popitem(last=False)
+        return None
+
+    def pop(self, key, default=None):
+        return self._data.pop(key, default)
+
+    def keys(self):
+        return list(self._data.keys())
+
+    def items(self):
+        return list(self._data.items())
+
+    def clear(self):
+        self._data.clear()
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.evictions,
+                         self.maxsize, len(self._data))
+
+    def reset_stats(self):
+        self.hits = self.misses = self.evictions = 0
@@ -1,37 +1,73 @@
 import bisect
-import fnmatch
+import heapq
 import logging
-import re
+import operator
+import threading
+import time
+from collections.abc import Iterator
 
+from .cache import LRUCache
 from .interfaces import EventDispatcher
 from .interfaces import EventHandler
 from .interfaces import HandlerException
+from .interfaces import UnhandledEventException
+from .patterns import PatternIndex
+from .patterns import is_glob
 
 log = logging.getLogger(__name__)
 
 
+# The kinds of event handler understood by the chain executor
+OBSERVE = 'observe'
+BATCH_OBSERVE = 'batch_observe'
+INTERCEPT = 'intercept'
+IMPLEMENT = 'implement'
+
+
 class BaseEventHandler(EventHandler):
 
-    def __init__(self, event_pattern, priority, callback):
-        self.__dispatcher = None
+    # callback and dispatcher are plain attributes, so that they can be
+    # accessed directly when executing a handler chain
+    __slots__ = ('callback', 'dispatcher', 'sender_type', 'match',
+                 '__event_pattern', '__priority', '__weakref__')
+
+    # Determines how the handler is executed as part of a handler chain. Must
+    # be one of OBSERVE, BATCH_OBSERVE, INTERCEPT or IMPLEMENT.
+    kind = None
+
+    def __init__(self, event_pattern, priority, callback, sender_type=None,
+                 match=None):
+        self.dispatcher = None
         self.__event_pattern = event_pattern
         self.__priority = priority
-        self.__callback = callback
+        self.callback = callback
+        # Optional filters, which skip the handler unless the sender is an
+        # instance of sender_type, and each keyword argument named in match
+        # was passed with the given value
+        self.sender_type = sender_type
+        self.match = dict(match) if match else None
 
     def __lt__(self, other):
-        # This is required for the bisect module to insert
-        # event handlers sorted by priority
+        # Allows event handlers to be sorted by priority
         return self.priority < other.priority
 
-    def _get_next_handler(self, event):
-        handler_list = self.dispatcher.get_handlers_for_event(event)
-        # find position of this handler
-        pos = bisect.bisect_left(handler_list, self)
-        assert handler_list[pos] == self
-        if pos < len(handler_list)-1:
-            return handler_list[pos+1]
-        else:
+    def _get_link(self, event, sender):
+        if not self.dispatcher:
             return None
+        chain = self.dispatcher.get_chain_for_event(event)
+        if chain.sender_filtered:
+            chain = chain.for_sender_type(type(sender))
+        return chain.link_for(self)
+
+    def invoke(self, event_args, *args, **kwargs):
+        # Only used when this handler is invoked directly, instead of through
+        # the link in the event's handler chain, which already knows its
+        # successor
+        link = self._get_link(event_args.get('event'),
+                              event_args.get('sender'))
+        if not link:
+            link = HandlerLink(self, None)
+        return link.invoke(event_args, *args, **kwargs)
 
     @property
     def event_pattern(self):
@@ -41,23 +77,6 @@ class BaseEventHandler(EventHandler):
     def priority(self):
         return self.__priority
 
-    @property
-    def callback(self):
-        return self.__callback
-
-    @callback.setter
-    def callback(self, value):
-        self.__callback = value
-
-    @property
-    def dispatcher(self):
-        return self.__dispatcher
-
-    @dispatcher.setter
-    # pylint:disable=arguments-differ
-    def dispatcher(self, value):
-        self.__dispatcher = value
-
     def unsubscribe(self):
         if self.dispatcher:
             self.dispatcher.unsubscribe(self)
@@ -66,104 +85,885 @@ class BaseEventHandler(EventHandler):
 
 class InterceptingEventHandler(BaseEventHandler):
 
-    def __init__(self, event_pattern, priority, callback):
-        super(InterceptingEventHandler, self).__init__(event_pattern, priority,
-                                                       callback)
+    __slots__ = ()
 
-    def invoke(self, event_args, *args, **kwargs):
-        next_handler = self._get_next_handler(event_args.get('event'))
-        event_args['next_handler'] = next_handler
-        # callback is responsible for invoking the next_handler and
-        # controlling the result value
-        result = self.callback(event_args, *args, **kwargs)
-        # Remove handler specific callback info
-        event_args.pop('next_handler', None)
-        return result
+    kind = INTERCEPT
+
+    def __init__(self, event_pattern, priority, callback, sender_type=None,
+                 match=None):
+        super(InterceptingEventHandler, self).__init__(
+            event_pattern, priority, callback, sender_type, match)
 
 
 class ObservingEventHandler(BaseEventHandler):
 
-    def __init__(self, event_pattern, priority, callback):
-        super(ObservingEventHandler, self).__init__(event_pattern, priority,
-                                                    callback)
+    __slots__ = ('executor',)
 
-    def invoke(self, event_args, *args, **kwargs):
-        # Observers shouldn't pass a next_handler
+    kind = OBSERVE
+
+    def __init__(self, event_pattern, priority, callback, executor=None,
+                 sender_type=None, match=None):
+        super(ObservingEventHandler, self).__init__(
+            event_pattern, priority, callback, sender_type, match)
+        # An optional ObserverExecutor to run the callback in the background.
+        # Defaults to the observer_executor of the dispatcher, if any.
+        self.executor = executor
+
+
+class ImplementingEventHandler(BaseEventHandler):
+
+    __slots__ = ('stream',)
+
+    kind = IMPLEMENT
+
+    def __init__(self, event_pattern, priority, callback, sender_type=None,
+                 match=None, stream=False):
+        super(ImplementingEventHandler, self).__init__(
+            event_pattern, priority, callback, sender_type, match)
+        # Whether an iterator returned by the callback is wrapped in a
+        # ResultStream. Other results are always passed on as is.
+        self.stream = stream
+
+
+class BatchObservingEventHandler(BaseEventHandler):
+    """
+    An observing handler which receives all items of a `dispatch_many` call
+    in a single callback, once the chain has run for each of them. The
+    callback must have a signature of the form:
+    `def callback(event_args, batch)`
+    where batch is a list of (args, kwargs) tuples, one per dispatched item,
+    and event_args contains the list of per item results under 'results'.
+    For a regular dispatch, the callback receives a batch with a single item,
+    at its position in the chain, and event_args has no 'results' key.
+    """
+
+    __slots__ = ()
+
+    kind = BATCH_OBSERVE
+
+    def __init__(self, event_pattern, priority, callback, sender_type=None,
+                 match=None):
+        super(BatchObservingEventHandler, self).__init__(
+            event_pattern, priority, callback, sender_type, match)
+
+
+class ResultStream(object):
+    """
+    Wraps an iterator returned by an implementing handler subscribed with
+    `stream=True`, so that large results can flow through the handler chain
+    without being materialized.
+    Handlers that follow the implementer receive the stream as
+    event_args['result'], and intercepting handlers receive it as the return
+    value of `next_handler.invoke`. Either may register per item transforms
+    through `map` and `filter`, which are applied lazily, in the order in
+    which they were registered, as the caller iterates over the stream.
+    Transforms registered after iteration has started only apply to the
+    remaining items.
+    """
+
+    __slots__ = ('__iterator', '__steps')
+
+    def __init__(self, iterable):
+        self.__iterator = iter(iterable)
+        # list of (func, is_filter) tuples
+        self.__steps = []
+
+    def map(self, func):
+        """
+        Registers a function which is applied to each item. Returns the
+        stream, so that calls can be chained.
+        """
+        self.__steps.append((func, False))
+        return self
+
+    def filter(self, predicate):
+        """
+        Registers a predicate, and skips items for which it returns a false
+        value. Returns the stream, so that calls can be chained.
+        """
+        self.__steps.append((predicate, True))
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while True:
+            item = next(self.__iterator)
+            for func, is_filter in self.__steps:
+                if not is_filter:
+                    item = func(item)
+                elif not func(item):
+                    break
+            else:
+                return item
+
+    def close(self):
+        """
+        Closes the underlying iterator, if it supports closing.
+        """
+        close = getattr(self.__iterator, 'close', None)
+        if close:
+            close()
+
+
+def _stream_result(value):
+    """
+    Wraps an iterator returned by an implementing handler in a ResultStream.
+    Other values, including lists and other re-iterable containers, are
+    returned as is.
+    """
+    if isinstance(value, Iterator) and not isinstance(value, ResultStream):
+        return ResultStream(value)
+    return value
+
+
+# Distinguishes keyword arguments which were not passed from those passed
+# with a value of None
+_MISSING = object()
+
+
+def _matches(match, kwargs):
+    """
+    Returns whether kwargs has the value given for each keyword argument in
+    match, a sequence of (name, value) pairs.
+    """
+    for name, value in match:
+        if kwargs.get(name, _MISSING) != value:
+            return False
+    return True
+
+
+def _run_chain(link, event_args, args, kwargs):
+    """
+    Executes the handler chain starting at link, and returns the result of
+    the chain.
+
+    Observers and implementers simply hand over to the next handler once
+    their callback returns, so rather than each handler invoking its
+    successor, consecutive observers and implementers are executed in a
+    loop. Only intercepting handlers, which wrap the remainder of the chain,
+    add to the depth of the stack.
+    """
+    result = None
+    has_result = False
+    # Whether an implementer has added its result to event_args
+    has_implemented = False
+    # Instrumentation is set on every link of a chain, or on none of them
+    monitor = link.monitor
+    while link is not None:
+        handler = link.handler
+        next_link = link.next
+        match = link.match
+        if match is not None and not _matches(match, kwargs):
+            # Filtered out handlers are skipped before they are timed
+            link = next_link
+            continue
+        kind = link.kind
+        if monitor is not None:
+            token = monitor.start(event_args.get('event'), handler)
+        try:
+            if kind is OBSERVE:
+                # Observers shouldn't pass a next_handler
+                event_args.pop('next_handler', None)
+                executor = handler.executor
+                if executor is None:
+                    executor = getattr(handler.dispatcher,
+                                       'observer_executor', None)
+                if executor:
+                    # Pass a copy of event_args, since downstream handlers
+                    # will continue to modify it while the callback is
+                    # pending
+                    executor.submit(handler.callback, dict(event_args),
+                                    *args, **kwargs)
+                else:
+                    # Notify listener. Ignore result from observable handler
+                    handler.callback(event_args, *args, **kwargs)
+            elif kind is BATCH_OBSERVE:
+                event_args.pop('next_handler', None)
+                handler.callback(event_args, [(args, kwargs)])
+            elif kind is IMPLEMENT:
+                value = handler.callback(*args, **kwargs)
+                if link.stream:
+                    value = _stream_result(value)
+                if not has_result:
+                    result = value
+                    has_result = True
+                if next_link:
+                    event_args['next_handler'] = next_link
+                    event_args['result'] = value
+                    has_implemented = True
+            else:
+                if kind is INTERCEPT:
+                    event_args['next_handler'] = next_link
+                    # callback is responsible for invoking the next_handler
+                    # and controlling the result value
+                    value = handler.callback(event_args, *args, **kwargs)
+                    # Remove handler specific callback info
+                    event_args.pop('next_handler', None)
+                else:
+                    # Handlers that don't derive from BaseEventHandler are
+                    # responsible for invoking the remainder of the chain
+                    value = handler.invoke(event_args, *args, **kwargs)
+                if not has_result:
+                    result = value
+                # The remainder of the chain has already been invoked
+                next_link = None
+        except Exception:
+            if monitor is not None:
+                monitor.finish(event_args.get('event'), handler, token, True)
+            raise
+        if monitor is not None:
+            monitor.finish(event_args.get('event'), handler, token)
+        link = next_link
+    if has_implemented:
+        event_args.pop('result', None)
         event_args.pop('next_handler', None)
-        next_handler = self._get_next_handler(event_args.get('event'))
-        # Notify listener. Ignore result from observable handler
-        self.callback(event_args, *args, **kwargs)
-        # Kick off the remaining handler chain
-        if next_handler:
-            return next_handler.invoke(event_args, *args, **kwargs)
+    return result
+
+
+# Marks a result which may or may not have been set by the generated code of
+# a handler chain, depending on which filtered handlers ran
+_MAYBE = object()
+
+
+def _implemented_cleanup(has_implemented):
+    # Lines which remove the result of implementers from event_args, once
+    # the remainder of the chain has run
+    lines = ["event_args.pop('result', None)",
+             "event_args.pop('next_handler', None)"]
+    if has_implemented is _MAYBE:
+        return ["if has_implemented:"] + ["    " + line for line in lines]
+    return lines if has_implemented else []
+
+
+def _compile_segment(link):
+    """
+    Generates a function which executes the handler chain starting at link,
+    in the same way as _run_chain, up to and including the first handler
+    which invokes the remainder of the chain itself. Rather than looping over
+    the links and branching on the kind of each handler, the generated code
+    calls the callbacks in sequence, and only updates event_args where the
+    handler kinds require it. Handlers which are filtered on their keyword
+    arguments are wrapped in a conditional block.
+    """
+    namespace = {'_stream_result': _stream_result, '_matches': _matches}
+    lines = ["def run(event_args, args, kwargs):"]
+    # The observer_executor of each dispatcher of an observing handler is
+    # read once, at the start of the segment
+    dispatchers = {}
+    # Whether event_args may contain a next_handler at this point
+    has_next_handler = True
+    # Whether the result has been set, or _MAYBE if that is only known at
+    # runtime, through the has_result variable
+    has_result = False
+    tracks_result = False
+    # Whether an implementer has added its result to event_args, or _MAYBE
+    # if only a filtered one may have, through the has_implemented variable
+    has_implemented = False
+    tracks_implemented = False
+    i = 0
+    while link is not None:
+        handler = 'h{0}'.format(i)
+        namespace[handler] = link.handler
+        next_link = 'l{0}'.format(i)
+        namespace[next_link] = link.next
+        kind = link.kind
+        conditional = link.match is not None
+        if conditional:
+            namespace['m{0}'.format(i)] = link.match
+            lines.append("    if _matches(m{0}, kwargs):".format(i))
+        body = []
+        if kind is OBSERVE or kind is BATCH_OBSERVE:
+            if has_next_handler:
+                body.append("event_args.pop('next_handler', None)")
+                has_next_handler = conditional
+        if kind is OBSERVE:
+            dispatcher = link.handler.dispatcher
+            if id(dispatcher) not in dispatchers:
+                dispatchers[id(dispatcher)] = 'x{0}'.format(len(dispatchers))
+                namespace['d' + dispatchers[id(dispatcher)]] = dispatcher
+            body += [
+                "executor = {0}.executor".format(handler),
+                "if executor is None:",
+                "    executor = " + dispatchers[id(dispatcher)],
+                "if executor:",
+                "    executor.submit({0}.callback, dict(event_args), "
+                "*args, **kwargs)".format(handler),
+                "else:",
+                "    {0}.callback(event_args, *args, **kwargs)".format(
+                    handler)]
+        elif kind is BATCH_OBSERVE:
+            body.append("{0}.callback(event_args, [(args, kwargs)])"
+                        .format(handler))
+        elif kind is IMPLEMENT:
+            if link.stream:
+                body.append("value = _stream_result({0}.callback(*args, "
+                            "**kwargs))".format(handler))
+            else:
+                body.append("value = {0}.callback(*args, **kwargs)".format(
+                    handler))
+            if has_result is False:
+                body.append("result = value")
+            elif has_result is _MAYBE:
+                body += ["if not has_result:", "    result = value"]
+            if has_result is not True:
+                if conditional:
+                    body.append("has_result = True")
+                    has_result = _MAYBE
+                    tracks_result = True
+                else:
+                    has_result = True
+            if link.next is not None:
+                body += ["event_args['next_handler'] = " + next_link,
+                         "event_args['result'] = value"]
+                has_next_handler = True
+                if has_implemented is not True:
+                    if conditional:
+                        body.append("has_implemented = True")
+                        has_implemented = _MAYBE
+                        tracks_implemented = True
+                    else:
+                        has_implemented = True
         else:
-            return None
+            if kind is INTERCEPT:
+                body += [
+                    "event_args['next_handler'] = " + next_link,
+                    "value = {0}.callback(event_args, *args, **kwargs)"
+                    .format(handler),
+                    "event_args.pop('next_handler', None)"]
+            else:
+                body.append("value = {0}.invoke(event_args, *args, "
+                            "**kwargs)".format(handler))
+            if conditional:
+                # The remainder of the chain has been invoked if the handler
+                # ran, and otherwise continues with the next handler
+                body += _implemented_cleanup(has_implemented)
+                if has_result is False:
+                    body.append("return value")
+                elif has_result is _MAYBE:
+                    body.append("return result if has_result else value")
+                else:
+                    body.append("return result")
+            elif has_result is False:
+                body.append("result = value")
+                has_result = True
+            elif has_result is _MAYBE:
+                body += ["if not has_result:", "    result = value"]
+                has_result = True
+        indent = "        " if conditional else "    "
+        lines += [indent + line for line in body]
+        if kind not in (OBSERVE, BATCH_OBSERVE, IMPLEMENT) and not conditional:
+            break
+        link = link.next
+        i += 1
+    lines += ["    " + line for line in _implemented_cleanup(has_implemented)]
+    lines.append("    return None" if has_result is False
+                 else "    return result")
+    if tracks_result:
+        lines[1:1] = ["    result = None", "    has_result = False"]
+    if tracks_implemented:
+        lines[1:1] = ["    has_implemented = False"]
+    lines[1:1] = ["    {0} = getattr(d{0}, 'observer_executor', None)".format(
+        name) for name in dispatchers.values()]
+    exec(compile("\n".join(lines), "<handler chain>", "exec"), namespace)
+    return namespace['run']
 
 
-class ImplementingEventHandler(BaseEventHandler):
+class HandlerLink(EventHandler):
+    """
+    The position of an event handler within a HandlerChain. A link holds a
+    direct reference to its successor, so that invoking it moves along the
+    chain without having to look up the next handler. This is what is passed
+    to intercepting handlers as the `next_handler`, and it exposes the same
+    properties as the event handler it wraps.
+    """
+
+    __slots__ = ('handler', 'next', 'kind', 'match', 'stream', 'monitor',
+                 'compiled')
 
-    def __init__(self, event_pattern, priority, callback):
-        super(ImplementingEventHandler, self).__init__(event_pattern, priority,
-                                                       callback)
+    def __init__(self, handler, next_link, monitor=None):
+        self.handler = handler
+        self.next = next_link
+        self.kind = getattr(handler, 'kind', None)
+        # The keyword arguments the handler is filtered on, as a tuple of
+        # (name, value) pairs, or None
+        match = getattr(handler, 'match', None)
+        self.match = tuple(match.items()) if match else None
+        # Whether the results of an implementing handler are streamed
+        self.stream = getattr(handler, 'stream', False)
+        # An optional Instrumentation or DispatchProfiler, which is notified
+        # as each handler starts and finishes
+        self.monitor = monitor
+        # The function generated by _compile_segment for the remainder of
+        # the chain, if the chain has been compiled
+        self.compiled = None
+
+    @property
+    def event_pattern(self):
+        return self.handler.event_pattern
+
+    @property
+    def priority(self):
+        return self.handler.priority
+
+    @property
+    def callback(self):
+        return self.handler.callback
+
+    @property
+    def dispatcher(self):
+        return self.handler.dispatcher
 
     def invoke(self, event_args, *args, **kwargs):
-        result = self.callback(*args, **kwargs)
-        next_handler = self._get_next_handler(event_args.get('event'))
-        if next_handler:
-            event_args['next_handler'] = next_handler
-            event_args['result'] = result
-            next_handler.invoke(event_args, *args, **kwargs)
-            event_args.pop('result', None)
-            event_args.pop('next_handler', None)
-        return result
+        compiled = self.compiled
+        if compiled is not None:
+            return compiled(event_args, args, kwargs)
+        return _run_chain(self, event_args, args, kwargs)
+
+    def unsubscribe(self):
+        self.handler.unsubscribe()
+
+
+class HandlerChain(object):
+    """
+    An immutable, priority ordered chain of all handlers subscribed to an
+    event. Chains are built and cached by the dispatcher, and are replaced,
+    rather than modified, whenever the subscriptions for the event change.
+    """
+
+    def __init__(self, event, handlers, patterns=(), link_class=HandlerLink,
+                 monitor=None, compile_threshold=None):
+        self.event = event
+        self.handlers = tuple(handlers)
+        # The subscribed event patterns this chain was built from
+        self.patterns = tuple(patterns)
+        self.monitor = monitor
+        self.__links = {}
+        next_link = None
+        for handler in reversed(self.handlers):
+            next_link = link_class(handler, next_link, monitor)
+            self.__links[handler] = next_link
+        self.head = next_link
+        self.__bound_callbacks = None
+        self.__batch_split = None
+        # Whether any handler is filtered on the type of the sender, in which
+        # case the chain is dispatched through for_sender_type
+        self.sender_filtered = any(
+            getattr(h, 'sender_type', None) is not None for h in self.handlers)
+        self.__sender_chains = {}
+        self.__compile_threshold = compile_threshold
+        self.compiled = False
+        # The number of remaining dispatches after which the chain is
+        # compiled, or 0 if it should not be compiled. Chains with a monitor
+        # are never compiled.
+        self.compile_countdown = (compile_threshold or 0
+                                  if monitor is None else 0)
+
+    def __len__(self):
+        return len(self.handlers)
+
+    def __bool__(self):
+        return bool(self.handlers)
+
+    def link_for(self, handler):
+        return self.__links.get(handler)
+
+    def has_bound_callback(self, obj, func):
+        """
+        Returns whether any handler in this chain has func, bound to obj, as
+        its callback. This is equivalent to comparing each callback with
+        `func.__get__(obj)`, but only scans the handlers on first use.
+        """
+        if self.__bound_callbacks is None:
+            # Callbacks are held by the handlers in this chain, so the ids of
+            # the objects they are bound to remain valid for its lifetime
+            self.__bound_callbacks = frozenset(
+                (id(getattr(h.callback, '__self__', None)),
+                 getattr(h.callback, '__func__', h.callback))
+                for h in self.handlers)
+        return (id(obj), func) in self.__bound_callbacks
+
+    def for_sender_type(self, sender_type):
+        """
+        Returns the chain of handlers which accept senders of sender_type,
+        excluding those filtered on a different type of sender. The chain is
+        built on first use, and cached for each type of sender.
+        """
+        chain = self.__sender_chains.get(sender_type)
+        if chain is None:
+            chain = HandlerChain(
+                self.event,
+                [h for h in self.handlers
+                 if getattr(h, 'sender_type', None) is None or
+                 issubclass(sender_type, h.sender_type)],
+                self.patterns, type(self.head), self.monitor,
+                self.__compile_threshold)
+            # All of its handlers accept the sender
+            chain.sender_filtered = False
+            self.__sender_chains[sender_type] = chain
+        return chain
+
+    def split_batch_observers(self):
+        """
+        Returns the head of a chain for the individual items of a batch
+        dispatch, which excludes any batch observing handlers, along with the
+        list of batch observing handlers.
+        """
+        if self.__batch_split is None:
+            batch_observers = [h for h in self.handlers
+                               if getattr(h, 'kind', None) is BATCH_OBSERVE]
+            if batch_observers:
+                item_chain = HandlerChain(
+                    self.event,
+                    [h for h in self.handlers if h not in batch_observers],
+                    self.patterns, type(self.head), self.monitor)
+                if self.compiled:
+                    item_chain.compile()
+                self.__batch_split = (item_chain, batch_observers)
+            else:
+                self.__batch_split = (self, [])
+        item_chain, batch_observers = self.__batch_split
+        return item_chain.head, batch_observers
+
+    def compile(self):
+        """
+        Compiles the chain into generated functions, which are used when
+        the chain is invoked instead of iterating over its links. Chains
+        with instrumentation, or whose links define their own way of
+        invoking handlers, are not compiled.
+        """
+        self.compile_countdown = 0
+        link = self.head
+        if (self.compiled or self.monitor is not None or link is None or
+                type(link).invoke is not HandlerLink.invoke):
+            return
+        # Intercepting handlers invoke the remainder of the chain through
+        # the next link, so each link which follows one starts a new segment
+        start = True
+        while link is not None:
+            if start:
+                link.compiled = _compile_segment(link)
+            start = link.kind not in (OBSERVE, BATCH_OBSERVE, IMPLEMENT)
+            link = link.next
+        self.compiled = True
+        item_chain = self.__batch_split and self.__batch_split[0]
+        if item_chain and item_chain is not self:
+            item_chain.compile()
 
 
 class PlaceHoldingEventHandler(object):
 
-    def __init__(self, event_pattern, priority, callback, handler_class):
+    def __init__(self, event_pattern, priority, callback, handler_class,
+                 sender_type=None, match=None, stream=False):
         self.event_pattern = event_pattern
         self.priority = priority
         self.callback = callback
         self.handler_class = handler_class
+        self.sender_type = sender_type
+        self.match = match
+        self.stream = stream
 
 
-class SimpleEventDispatcher(EventDispatcher):
+_get_priority = operator.attrgetter('priority')
+
+
+def _group_by_pattern(event_handlers):
+    """
+    Returns a dict of lists of the event handlers keyed by event pattern, in
+    order of first occurrence.
+    """
+    grouped = {}
+    for event_handler in event_handlers:
+        grouped.setdefault(event_handler.event_pattern, []).append(
+            event_handler)
+    return grouped
+
+
+def _first_duplicate(priorities):
+    """
+    Returns the first priority which occurs more than once in the ordered
+    sequence of priorities, or None if they are unique.
+    """
+    if len(set(priorities)) == len(priorities):
+        return None
+    for i in range(1, len(priorities)):
+        if priorities[i] == priorities[i - 1]:
+            return priorities[i]
+
+
+class _PriorityBucket(object):
+    """
+    An immutable, priority ordered collection of the handlers subscribed to
+    a single event pattern. Adding or removing handlers returns a new bucket.
+    Handlers with equal priorities are kept in order of subscription.
+    """
+
+    __slots__ = ('handlers', 'priorities', 'duplicate')
 
-    def __init__(self):
+    def __init__(self, handlers=(), priorities=None):
+        self.handlers = tuple(handlers)
+        if priorities is None:
+            priorities = tuple(h.priority for h in self.handlers)
+        self.priorities = priorities
+        # The lowest priority shared by more than one handler, if any
+        self.duplicate = _first_duplicate(priorities)
+
+    def __len__(self):
+        return len(self.handlers)
+
+    def __iter__(self):
+        return iter(self.handlers)
+
+    def add(self, handlers):
+        if len(handlers) == 1:
+            priority = handlers[0].priority
+            i = bisect.bisect_right(self.priorities, priority)
+            return _PriorityBucket(
+                self.handlers[:i] + tuple(handlers) + self.handlers[i:],
+                self.priorities[:i] + (priority,) + self.priorities[i:])
+        # The new handlers are in subscription order, so sort them before
+        # merging. Existing handlers come first among equal priorities.
+        return _PriorityBucket(heapq.merge(
+            self.handlers, sorted(handlers, key=_get_priority),
+            key=_get_priority))
+
+    def remove(self, handlers):
+        if len(handlers) == 1:
+            handler = handlers[0]
+            priorities = self.priorities
+            lo = bisect.bisect_left(priorities, handler.priority)
+            hi = bisect.bisect_right(priorities, handler.priority, lo)
+            for i in range(lo, hi):
+                if self.handlers[i] is handler:
+                    return _PriorityBucket(
+                        self.handlers[:i] + self.handlers[i + 1:],
+                        priorities[:i] + priorities[i + 1:])
+            raise ValueError("Handler {0} is not subscribed".format(handler))
+        removed = set(id(h) for h in handlers)
+        remaining = [h for h in self.handlers if id(h) not in removed]
+        if len(remaining) != len(self.handlers) - len(removed):
+            raise ValueError("Handlers {0} are not all subscribed".format(
+                handlers))
+        return _PriorityBucket(remaining)
+
+
+_EMPTY_BUCKET = _PriorityBucket()
+
+
+def _merge_buckets(buckets):
+    """
+    Merges the handlers of several buckets into a single priority ordered
+    list in one pass, and returns it along with the lowest priority shared
+    by more than one handler, or None if the priorities are unique.
+    """
+    if len(buckets) == 1:
+        return list(buckets[0].handlers), buckets[0].duplicate
+    merged = []
+    duplicate = None
+    previous = None
+    for handler in heapq.merge(*[b.handlers for b in buckets],
+                               key=_get_priority):
+        priority = handler.priority
+        if duplicate is None and merged and priority == previous:
+            duplicate = priority
+        previous = priority
+        merged.append(handler)
+    return merged, duplicate
+
+
+class _HandlerTables(object):
+    """
+    An immutable snapshot of the handlers subscribed to a dispatcher.
+    """
+
+    __slots__ = ('events', 'index', 'overlay')
+
+    def __init__(self, events, index, overlay=None):
         # The dict key is event_pattern.
-        # The dict value is a list of handlers for the event pattern, sorted
-        # by event priority
-        self.__events = {}
-        self.__handler_cache = {}
+        # The dict value is a _PriorityBucket of handlers for the event
+        # pattern
+        self.events = events
+        # Index of all event patterns in events, used to find the patterns
+        # matching an event without testing each one
+        self.index = index
+        # Index of the event patterns subscribed to or unsubscribed from
+        # since the dispatcher was derived from a template, or None. Only
+        # the chains of events matching these patterns differ from those
+        # of the template.
+        self.overlay = overlay
+
+
+class SimpleEventDispatcher(EventDispatcher):
+
+    # Default maximum number of events whose handler chains are cached
+    DEFAULT_CACHE_SIZE = 1024
+    # Default maximum number of unhandled events which are cached
+    DEFAULT_UNHANDLED_CACHE_SIZE = 1024
+    # The type of link used to invoke handlers in this dispatcher's chains
+    link_class = HandlerLink
+
+    # Policies for events dispatched without any subscribed handlers
+    IGNORE = 'ignore'
+    WARN = 'warn'
+    WARN_ONCE = 'warn_once'
+    RATE_LIMIT = 'rate_limit'
+    RAISE = 'raise'
+
+    def __init__(self, cache_size=DEFAULT_CACHE_SIZE, observer_executor=None,
+                 instrumentation=None, unhandled_policy=WARN,
+                 unhandled_cache_size=DEFAULT_UNHANDLED_CACHE_SIZE,
+                 unhandled_warning_interval=60.0, compile_threshold=None):
+        """
+        The unhandled_policy determines what happens when an event without
+        any subscribed handlers is dispatched:
+
+        IGNORE: nothing, apart from counting the event
+        WARN: log a warning every time
+        WARN_ONCE: log a warning the first time each event is dispatched
+        RATE_LIMIT: log at most one warning every unhandled_warning_interval
+            seconds, along with the number of warnings suppressed
+        RAISE: raise an UnhandledEventException
+
+        Unhandled events are cached separately from the handler chains, in
+        a cache holding at most unhandled_cache_size events, so that unique
+        unhandled event names do not evict the chains of handled events.
+
+        If compile_threshold is set, the handler chain of an event is
+        compiled into generated code once the event has been dispatched
+        that many times. Compiled chains are discarded along with the
+        chain when the subscriptions for the event change.
+        """
+        if unhandled_policy not in (self.IGNORE, self.WARN, self.WARN_ONCE,
+                                    self.RATE_LIMIT, self.RAISE):
+            raise ValueError("Unknown unhandled event policy: {0}".format(
+                unhandled_policy))
+        # Subscriptions are copied on write. Dispatching reads the current
+        # snapshot without locking, while subscribe and unsubscribe are
+        # serialized through the lock and publish a new snapshot.
+        self.__tables = _HandlerTables({}, PatternIndex())
+        self.__lock = threading.Lock()
+        # Handler chains keyed by event name. The cache is bounded, since
+        # event names may be unique, e.g. when they contain resource ids.
+        # A cache_size of None makes the cache unbounded.
+        self.__handler_cache = LRUCache(cache_size)
+        # Reverse index from each event pattern to the cached events whose
+        # handler chains it contributed to, so that subscription changes
+        # only invalidate the chains they affect
+        self.__pattern_dependents = {}
+        # An optional ObserverExecutor, which runs the callbacks of all
+        # observing handlers in the background
+        self.observer_executor = observer_executor
+        self.__instrumentation = instrumentation
+        # Empty handler chains of recently dispatched unhandled events
+        self.__unhandled_cache = LRUCache(unhandled_cache_size)
+        self.unhandled_policy = unhandled_policy
+        self.unhandled_warning_interval = unhandled_warning_interval
+        # The total number of unhandled events dispatched. The count may be
+        # approximate when events are dispatched concurrently.
+        self.unhandled_count = 0
+        # Events which have been warned about by the WARN_ONCE policy
+        self.__warned_events = LRUCache(unhandled_cache_size)
+        # State of the RATE_LIMIT policy
+        self.__last_warning = None
+        self.__suppressed_warnings = 0
+        # The FrozenEventDispatcher whose handler chains are shared by this
+        # dispatcher, for events which its own subscriptions do not affect.
+        # See derive.
+        self.__template = None
+        self.compile_threshold = compile_threshold
+
+    @property
+    def instrumentation(self):
+        """
+        An optional Instrumentation, which records call counts, exceptions
+        and latencies of the handlers invoked by this dispatcher, or a
+        DispatchProfiler. Set to None to disable instrumentation.
+        """
+        return self.__instrumentation
+
+    @instrumentation.setter
+    def instrumentation(self, value):
+        with self.__lock:
+            self.__instrumentation = value
+            self.__template = None
+            # Chains hold the instrumentation, so rebuild them. Publishing a
+            # new snapshot prevents chains which are being built from being
+            # cached.
+            tables = self.__tables
+            self.__tables = _HandlerTables(tables.events, tables.index,
+                                           tables.overlay)
+            self.__handler_cache.clear()
+            self.__unhandled_cache.clear()
+            self.__pattern_dependents.clear()
 
     def get_handlers_for_event(self, event):
-        handlers = self.__handler_cache.get(event)
-        if handlers is None:
-            self.__handler_cache[event] = self._create_handler_cache(
-                event)
-            return self.__handler_cache.get(event)
-        else:
-            return handlers
+        return list(self.get_chain_for_event(event).handlers)
 
-    def _create_handler_cache(self, event):
-        cache_list = []
-        # Find all patterns matching event
-        for key in self.__events.keys():
-            if re.search(fnmatch.translate(key), event):
-                cache_list.extend(self.__events[key])
-        cache_list.sort(key=lambda h: h.priority)
+    def get_chain_for_event(self, event):
+        template = self.__template
+        if template is not None:
+            overlay = self.__tables.overlay
+            if overlay is None or not overlay.match(event):
+                return template.get_chain_for_event(event)
+        chain = self.__handler_cache.get(event)
+        if chain is None:
+            chain = self.__unhandled_cache.get(event)
+            if chain is not None:
+                return chain
+            tables = self.__tables
+            patterns = tables.index.match(event)
+            chain = HandlerChain(
+                event, self._create_handler_cache(event, patterns, tables),
+                patterns, self.link_class, self.__instrumentation,
+                self.compile_threshold)
+            with self.__lock:
+                # Don't cache the chain if the subscriptions changed while it
+                # was being built, since it may already be stale
+                if tables is not self.__tables:
+                    pass
+                elif not chain:
+                    self.__unhandled_cache.put(event, chain)
+                else:
+                    for pattern in patterns:
+                        self.__pattern_dependents.setdefault(
+                            pattern, set()).add(event)
+                    evicted = self.__handler_cache.put(event, chain)
+                    if evicted:
+                        self._forget_chain(*evicted)
+        return chain
 
-        # Make sure all priorities are unique
-        priority_list = [h.priority for h in cache_list]
-        if len(set(priority_list)) != len(priority_list):
-            guilty_prio = None
-            for prio in priority_list:
-                if prio == guilty_prio:
-                    break
-                guilty_prio = prio
+    def cache_info(self):
+        """
+        Returns the hits, misses, evictions, maxsize and current size of the
+        handler chain cache as a named tuple. Lookups of unhandled events are
+        counted as misses.
+        """
+        return self.__handler_cache.info()
+
+    def unhandled_cache_info(self):
+        """
+        Returns the hits, misses, evictions, maxsize and current size of the
+        unhandled event cache as a named tuple.
+        """
+        return self.__unhandled_cache.info()
+
+    def cache_clear(self):
+        with self.__lock:
+            self.__handler_cache.clear()
+            self.__handler_cache.reset_stats()
+            self.__unhandled_cache.clear()
+            self.__unhandled_cache.reset_stats()
+            self.__pattern_dependents.clear()
 
-            # guilty_prio should never be none since we checked for
-            # duplicates before iterating
+    def _create_handler_cache(self, event, patterns, tables):
+        if not patterns:
+            return []
+        cache_list, guilty_prio = _merge_buckets(
+            [tables.events[key] for key in patterns])
+
+        # Make sure all priorities are unique
+        if guilty_prio is not None:
             guilty_names = [h.callback.__name__ for h in cache_list
                             if h.priority == guilty_prio]
 
@@ -175,49 +975,350 @@ class SimpleEventDispatcher(EventDispatcher):
             raise HandlerException(message)
         return cache_list
 
-    def _invalidate_cache(self, event_pattern):
-        # Only invalidate events that are affected by the pattern
-        for key in list(self.__handler_cache.keys()):
-            if re.search(fnmatch.translate(event_pattern), key):
-                del self.__handler_cache[key]
+    def _forget_chain(self, event, chain):
+        for pattern in chain.patterns:
+            dependents = self.__pattern_dependents.get(pattern)
+            if dependents is not None:
+                dependents.discard(event)
+                if not dependents:
+                    del self.__pattern_dependents[pattern]
+
+    def _invalidate_cache(self, event_patterns, new_patterns=()):
+        # Only invalidate events that are affected by the patterns. Chains
+        # that an existing pattern contributed to are found through the
+        # reverse index. Cached events can only be affected by a newly
+        # subscribed pattern if they match it, which does not require a scan
+        # for literal patterns.
+        stale = set()
+        for pattern in event_patterns:
+            stale.update(self.__pattern_dependents.get(pattern, ()))
+        new_globs = PatternIndex()
+        for pattern in new_patterns:
+            if is_glob(pattern):
+                new_globs.add(pattern)
+            elif pattern in self.__handler_cache:
+                stale.add(pattern)
+            else:
+                self.__unhandled_cache.pop(pattern)
+        if len(new_globs):
+            stale.update(key for key in self.__handler_cache.keys()
+                         if new_globs.match(key))
+            for key in self.__unhandled_cache.keys():
+                if new_globs.match(key):
+                    self.__unhandled_cache.pop(key)
+        for key in stale:
+            chain = self.__handler_cache.pop(key)
+            if chain is not None:
+                self._forget_chain(key, chain)
 
     def subscribe(self, event_handler):
-        event_handler.dispatcher = self
-        handler_list = self.__events.get(event_handler.event_pattern, [])
-        handler_list.append(event_handler)
-        self.__events[event_handler.event_pattern] = handler_list
-        self._invalidate_cache(event_handler.event_pattern)
+        self.subscribe_many([event_handler])
+
+    def _overlay_patterns(self, patterns):
+        # Returns the overlay of the tables once the given patterns change
+        overlay = self.__tables.overlay
+        if self.__template is None or (
+                overlay is not None and all(p in overlay for p in patterns)):
+            return overlay
+        overlay = overlay.copy() if overlay is not None else PatternIndex()
+        for pattern in patterns:
+            overlay.add(pattern)
+        return overlay
+
+    def subscribe_many(self, event_handlers):
+        with self.__lock:
+            events = dict(self.__tables.events)
+            new_patterns = []
+            added = _group_by_pattern(event_handlers)
+            for pattern, handlers in added.items():
+                for event_handler in handlers:
+                    event_handler.dispatcher = self
+                bucket = events.get(pattern)
+                if bucket is None:
+                    bucket = _EMPTY_BUCKET
+                    new_patterns.append(pattern)
+                events[pattern] = bucket.add(handlers)
+            patterns = set(added)
+            # The index only changes when patterns are added
+            index = self.__tables.index
+            if new_patterns:
+                index = index.copy()
+                for pattern in new_patterns:
+                    index.add(pattern)
+            self.__tables = _HandlerTables(events, index,
+                                           self._overlay_patterns(patterns))
+            self._invalidate_cache(patterns, new_patterns)
 
     def unsubscribe(self, event_handler):
-        handler_list = self.__events.get(event_handler.event_pattern, [])
-        handler_list.remove(event_handler)
-        event_handler.dispatcher = None
-        self._invalidate_cache(event_handler.event_pattern)
+        self.unsubscribe_many([event_handler])
+
+    def unsubscribe_many(self, event_handlers):
+        with self.__lock:
+            events = dict(self.__tables.events)
+            index = self.__tables.index
+            patterns = set()
+            try:
+                removed = _group_by_pattern(event_handlers)
+                for pattern, handlers in removed.items():
+                    bucket = events.get(pattern, _EMPTY_BUCKET).remove(
+                        handlers)
+                    patterns.add(pattern)
+                    if bucket:
+                        events[pattern] = bucket
+                    else:
+                        del events[pattern]
+                        # The index only changes when patterns are removed
+                        if index is self.__tables.index:
+                            index = index.copy()
+                        index.remove(pattern)
+                    for event_handler in handlers:
+                        # Handlers shared with a template belong to another
+                        # dispatcher
+                        if event_handler.dispatcher is self:
+                            event_handler.dispatcher = None
+            finally:
+                self.__tables = _HandlerTables(
+                    events, index, self._overlay_patterns(patterns))
+                self._invalidate_cache(patterns)
+
+    def observe(self, event_pattern, priority, callback, executor=None,
+                sender_type=None, match=None):
+        handler = ObservingEventHandler(event_pattern, priority, callback,
+                                        executor, sender_type, match)
+        self.subscribe(handler)
+        return handler
 
-    def observe(self, event_pattern, priority, callback):
-        handler = ObservingEventHandler(event_pattern, priority, callback)
+    def intercept(self, event_pattern, priority, callback, sender_type=None,
+                  match=None):
+        handler = InterceptingEventHandler(event_pattern, priority, callback,
+                                           sender_type, match)
         self.subscribe(handler)
         return handler
 
-    def intercept(self, event_pattern, priority, callback):
-        handler = InterceptingEventHandler(event_pattern, priority, callback)
+    def implement(self, event_pattern, priority, callback, sender_type=None,
+                  match=None, stream=False):
+        handler = ImplementingEventHandler(event_pattern, priority, callback,
+                                           sender_type, match, stream)
         self.subscribe(handler)
         return handler
 
-    def implement(self, event_pattern, priority, callback):
-        handler = ImplementingEventHandler(event_pattern, priority, callback)
+    def observe_batch(self, event_pattern, priority, callback,
+                      sender_type=None, match=None):
+        handler = BatchObservingEventHandler(event_pattern, priority, callback,
+                                             sender_type, match)
         self.subscribe(handler)
         return handler
 
+    def dispatch_many(self, sender, event, iterable_of_args, **kwargs):
+        """
+        Dispatches an event once for each item in iterable_of_args, resolving
+        the handlers for the event only once. Each item is a tuple of
+        positional arguments for one dispatch, or a single positional
+        argument if it is not a tuple. Any keyword arguments are passed to
+        every dispatch.
+
+        Returns the list of results, one per item. Batch observing handlers
+        are notified once all items have been dispatched.
+        """
+        return list(self.dispatch_many_lazy(sender, event, iterable_of_args,
+                                            **kwargs))
+
+    def dispatch_many_lazy(self, sender, event, iterable_of_args, **kwargs):
+        """
+        Same as `dispatch_many`, but returns a generator which dispatches
+        each item as the results are consumed. Whether the event is handled
+        is checked immediately, rather than when iteration starts.
+        """
+        chain = self.get_chain_for_event(event)
+        if not chain:
+            self._handle_unhandled_event(event)
+        elif chain.sender_filtered:
+            chain = chain.for_sender_type(type(sender))
+        return self._dispatch_batch(chain, sender, event, iterable_of_args,
+                                    kwargs)
+
+    def _dispatch_batch(self, chain, sender, event, iterable_of_args, kwargs):
+        if not chain:
+            for _ in iterable_of_args:
+                yield None
+            return
+        if chain.compile_countdown:
+            # The chain is invoked for every item, so it is hot
+            chain.compile()
+        head, batch_observers = chain.split_batch_observers()
+        batch = []
+        results = []
+        for item in iterable_of_args:
+            args = item if isinstance(item, tuple) else (item,)
+            if head:
+                event_args = {'event': event, 'sender': sender}
+                result = head.invoke(event_args, *args, **kwargs)
+            else:
+                result = None
+            if batch_observers:
+                batch.append((args, kwargs))
+                results.append(result)
+            yield result
+        if batch_observers:
+            event_args = {'event': event, 'sender': sender,
+                          'results': results}
+            for handler in batch_observers:
+                if handler.match and not _matches(handler.match.items(),
+                                                  kwargs):
+                    continue
+                handler.callback(event_args, batch)
+
     def dispatch(self, sender, event, *args, **kwargs):
-        handlers = self.get_handlers_for_event(event)
+        chain = self.get_chain_for_event(event)
 
-        if handlers:
+        if chain:
+            if chain.sender_filtered:
+                chain = chain.for_sender_type(type(sender))
+                if not chain:
+                    # The event is handled, just not for this sender
+                    return None
+            if chain.compile_countdown:
+                # The count may be decremented concurrently, in which case
+                # the chain is compiled a little later or earlier
+                chain.compile_countdown -= 1
+                if chain.compile_countdown <= 0:
+                    chain.compile()
+            elif chain.monitor is not None:
+                return self._dispatch_monitored(chain, sender, event, args,
+                                                kwargs)
             # only kick off first handler in chain
             event_args = {'event': event, 'sender': sender}
-            return handlers[0].invoke(event_args, *args, **kwargs)
+            return chain.head.invoke(event_args, *args, **kwargs)
         else:
-            message = "Event '{}' has no subscribed handlers.".\
-                format(event)
-            log.warning(message)
+            self._handle_unhandled_event(event)
             return None
+
+    def _dispatch_monitored(self, chain, sender, event, args, kwargs):
+        # The dispatch itself is reported to the monitor with no handler,
+        # so that it can be told apart from the handlers it invokes
+        monitor = chain.monitor
+        token = monitor.start(event, None)
+        try:
+            event_args = {'event': event, 'sender': sender}
+            result = chain.head.invoke(event_args, *args, **kwargs)
+        except Exception:
+            monitor.finish(event, None, token, True)
+            raise
+        monitor.finish(event, None, token)
+        return result
+
+    def freeze(self, cache_size=DEFAULT_CACHE_SIZE):
+        """
+        Returns a FrozenEventDispatcher holding a snapshot of the handlers
+        currently subscribed to this dispatcher. Subscribing or unsubscribing
+        handlers afterwards does not affect the snapshot.
+
+        The handlers of methods decorated with `dispatch` cannot be part of
+        a template, since they are bound to the object which dispatches the
+        event. Add such objects to each derived dispatcher instead.
+        """
+        bound = [h for bucket in self.__tables.events.values()
+                 for h in bucket.handlers
+                 if getattr(getattr(h.callback, '__func__', None),
+                            '__dispatched_event', None) is not None]
+        if bound:
+            raise HandlerException(
+                "Cannot freeze a dispatcher with handlers of dispatch "
+                "decorated methods, which are bound to a single object: "
+                "[{0}]. Subscribe them to the derived dispatchers instead."
+                .format(", ".join(h.callback.__qualname__ for h in bound)))
+        template = FrozenEventDispatcher(
+            cache_size, self.observer_executor, self.__instrumentation,
+            compile_threshold=self.compile_threshold)
+        template._adopt(self)
+        return template
+
+    def _adopt(self, source, template=None):
+        # Replaces the subscriptions of this dispatcher with those of source,
+        # without copying them, since they are copied on write
+        with self.__lock:
+            tables = source.__tables
+            self.__tables = _HandlerTables(tables.events, tables.index)
+            self.__template = template
+            self.__handler_cache.clear()
+            self.__unhandled_cache.clear()
+            self.__pattern_dependents.clear()
+
+    def _handle_unhandled_event(self, event):
+        self.unhandled_count += 1
+        policy = self.unhandled_policy
+        if policy == self.IGNORE:
+            return
+        elif policy == self.WARN_ONCE:
+            if event in self.__warned_events:
+                return
+            with self.__lock:
+                self.__warned_events.put(event, True)
+        elif policy == self.RATE_LIMIT:
+            now = time.monotonic()
+            if (self.__last_warning is not None and
+                    now - self.__last_warning <
+                    self.unhandled_warning_interval):
+                self.__suppressed_warnings += 1
+                return
+            self.__last_warning = now
+            suppressed = self.__suppressed_warnings
+            self.__suppressed_warnings = 0
+            if suppressed:
+                log.warning("Event '%s' has no subscribed handlers. %d "
+                            "similar warnings were suppressed.", event,
+                            suppressed)
+                return
+        elif policy == self.RAISE:
+            raise UnhandledEventException(
+                "Event '{0}' has no subscribed handlers.".format(event))
+        log.warning("Event '%s' has no subscribed handlers.", event)
+
+
+class FrozenEventDispatcher(SimpleEventDispatcher):
+    """
+    An immutable snapshot of the handlers subscribed to a dispatcher, created
+    through `SimpleEventDispatcher.freeze`. A frozen dispatcher can dispatch
+    events, but not be subscribed to. Instead, it serves as a template for
+    any number of dispatchers with the same handlers, which are cheaply
+    created through `derive`, e.g. one per provider:
+
+        template = dispatcher.freeze()
+        manager = SimpleMiddlewareManager(template.derive())
+
+    Derived dispatchers share the handler objects of the template, and its
+    resolved handler chains. Handlers subscribed to or unsubscribed from a
+    derived dispatcher form an overlay over the template: only the chains of
+    events matching the patterns of those handlers are built by the derived
+    dispatcher, while all other events keep using the chains of the
+    template. Handlers of the template keep referring to the dispatcher they
+    were originally subscribed to.
+
+    Objects with `dispatch` decorated methods, such as providers, must be
+    added to each derived dispatcher rather than to the template, since the
+    handlers of these methods are bound to a single object.
+    """
+
+    def subscribe_many(self, event_handlers):
+        raise HandlerException(
+            "Cannot subscribe to a frozen event dispatcher. Subscribe to a "
+            "dispatcher derived from it instead.")
+
+    def unsubscribe_many(self, event_handlers):
+        raise HandlerException(
+            "Cannot unsubscribe from a frozen event dispatcher. Unsubscribe "
+            "from a dispatcher derived from it instead.")
+
+    def derive(self, dispatcher_class=SimpleEventDispatcher, **kwargs):
+        """
+        Returns a new dispatcher of class dispatcher_class, with the handlers
+        of this template subscribed to it. Additional keyword arguments are
+        passed to the dispatcher's constructor. Handler chains are only
+        shared with the template if they are invoked in the same way, i.e.
+        if the dispatcher has the same link_class and no instrumentation.
+        """
+        dispatcher = dispatcher_class(**kwargs)
+        shared = (dispatcher.link_class is self.link_class and
+                  dispatcher.instrumentation is None)
+        dispatcher._adopt(self, self if shared else None)
+        return dispatcher
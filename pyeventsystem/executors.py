@@ -0,0 +1,110 @@
+import logging
+import threading
+from concurrent import futures
+
+log = logging.getLogger(__name__)
+
+
+class ObserverExecutor(object):
+    """
+    Runs observer callbacks in the background on a thread pool, so that the
+    handler chain can continue without waiting for them. At most
+    `max_pending` callbacks may be queued or running at any time. When that
+    limit is reached, the `overflow` policy determines what happens to new
+    callbacks:
+
+    BLOCK: wait until a pending callback completes
+    DROP: discard the callback, incrementing the `dropped` counter
+    INLINE: run the callback synchronously in the dispatching thread
+
+    Callbacks submitted after the executor has been shut down are run inline
+    under the INLINE policy, and are otherwise dropped.
+
+    Exceptions raised by callbacks are logged, and never propagate to the
+    dispatcher.
+    """
+
+    BLOCK = 'block'
+    DROP = 'drop'
+    INLINE = 'inline'
+
+    def __init__(self, max_workers=None, max_pending=1000, overflow=BLOCK):
+        if overflow not in (self.BLOCK, self.DROP, self.INLINE):
+            raise ValueError("Unknown overflow policy: {0}".format(overflow))
+        self.overflow = overflow
+        self.dropped = 0
+        self.__shutdown = False
+        self.__executor = futures.ThreadPoolExecutor(max_workers)
+        self.__slots = threading.BoundedSemaphore(max_pending)
+        self.__pending = set()
+        self.__lock = threading.Lock()
+
+    def submit(self, callback, *args, **kwargs):
+        if self.__shutdown:
+            self._reject(callback, args, kwargs)
+            return
+        if self.overflow == self.BLOCK:
+            self.__slots.acquire()
+        elif not self.__slots.acquire(False):
+            self._reject(callback, args, kwargs)
+            return
+        try:
+            future = self.__executor.submit(self._run, callback, args, kwargs)
+        except RuntimeError:
+            # The executor was shut down since the check above
+            self.__slots.release()
+            self._reject(callback, args, kwargs)
+            return
+        except Exception:
+            self.__slots.release()
+            raise
+        with self.__lock:
+            self.__pending.add(future)
+        future.add_done_callback(self._done)
+
+    def _reject(self, callback, args, kwargs):
+        if self.overflow == self.INLINE:
+            self._run(callback, args, kwargs, release=False)
+        else:
+            with self.__lock:
+                self.dropped += 1
+
+    def _run(self, callback, args, kwargs, release=True):
+        try:
+            callback(*args, **kwargs)
+        except Exception:
+            log.exception("Background observer %s raised an exception",
+                          getattr(callback, '__name__', callback))
+        finally:
+            if release:
+                self.__slots.release()
+
+    def _done(self, future):
+        with self.__lock:
+            self.__pending.discard(future)
+
+    @property
+    def pending(self):
+        """
+        The number of callbacks which are queued or running.
+        """
+        with self.__lock:
+            return len(self.__pending)
+
+    def flush(self, timeout=None):
+        """
+        Waits until all callbacks submitted so far have completed. Returns
+        True if they completed, or False if the timeout expired first.
+        """
+        with self.__lock:
+            pending = list(self.__pending)
+        _, not_done = futures.wait(pending, timeout)
+        return not not_done
+
+    def shutdown(self, wait=True):
+        """
+        Stops accepting new callbacks. If `wait` is True, pending callbacks
+        are drained before returning.
+        """
+        self.__shutdown = True
+        self.__executor.shutdown(wait)
@@ -0,0 +1,161 @@
+import threading
+from collections import namedtuple
+from time import perf_counter as _clock
+
+from .cache import LRUCache
+
+# The number of log2 histogram buckets. Bucket n counts the calls which took
+# less than 2**n nanoseconds, and at least 2**(n-1) nanoseconds.
+HISTOGRAM_BUCKETS = 64
+
+HandlerSnapshot = namedtuple('HandlerSnapshot', [
+    'event', 'handler', 'name', 'priority', 'calls', 'errors', 'total_time',
+    'mean', 'p50', 'p90', 'p99', 'max_time'])
+
+
+def _callback_name(callback):
+    name = getattr(callback, '__qualname__', None) or getattr(
+        callback, '__name__', None)
+    if name is None:
+        return repr(callback)
+    module = getattr(callback, '__module__', None)
+    return "{0}.{1}".format(module, name) if module else name
+
+
+class HandlerStats(object):
+    """
+    Call statistics for a single handler, on a single event. Latencies are
+    recorded in a histogram with power of two buckets, so percentiles are
+    approximate, and are reported as the upper bound of the bucket they fall
+    in.
+    """
+
+    __slots__ = ('calls', 'errors', 'total_time', 'max_time', 'histogram')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.histogram = [0] * HISTOGRAM_BUCKETS
+
+    def add(self, elapsed, failed):
+        self.calls += 1
+        if failed:
+            self.errors += 1
+        self.total_time += elapsed
+        if elapsed > self.max_time:
+            self.max_time = elapsed
+        bucket = min(int(elapsed * 1e9).bit_length(), HISTOGRAM_BUCKETS - 1)
+        self.histogram[bucket] += 1
+
+    def copy(self):
+        stats = HandlerStats()
+        stats.calls = self.calls
+        stats.errors = self.errors
+        stats.total_time = self.total_time
+        stats.max_time = self.max_time
+        stats.histogram = list(self.histogram)
+        return stats
+
+    def percentile(self, percent):
+        """
+        Returns the approximate latency, in seconds, below which the given
+        percentage of calls completed.
+        """
+        if not self.calls:
+            return 0.0
+        rank = self.calls * percent / 100.0
+        count = 0
+        for bucket, bucket_count in enumerate(self.histogram):
+            count += bucket_count
+            if count >= rank:
+                return min((1 << bucket) / 1e9, self.max_time)
+        return self.max_time
+
+
+class Instrumentation(object):
+    """
+    Records the number of calls, the number of exceptions raised and the
+    latency of each handler invoked by a dispatcher, per event. Pass an
+    instance to the dispatcher to enable instrumentation:
+
+        dispatcher = SimpleEventDispatcher(instrumentation=Instrumentation())
+
+    and call `snapshot` to read the statistics collected so far. The latency
+    of an intercepting handler includes the time spent in the remainder of
+    the chain, since it invokes the next handler itself. Observers run on an
+    executor are timed as the cost of submitting them.
+
+    Since a wildcard handler may be invoked for an unbounded number of
+    events, statistics are kept for at most `maxsize` handler and event
+    combinations, discarding the least recently invoked first. A `maxsize`
+    of None keeps them all.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.__stats = LRUCache(maxsize)
+        self.__lock = threading.Lock()
+
+    def start(self, event, handler):
+        """
+        Called by the dispatcher before invoking handler, or before
+        dispatching event if handler is None. Returns a token which is
+        passed to `finish`.
+        """
+        return _clock()
+
+    def finish(self, event, handler, token, failed=False):
+        """
+        Called by the dispatcher once handler, or the dispatch of event if
+        handler is None, has completed.
+        """
+        if handler is not None:
+            self.record(event, handler, _clock() - token, failed)
+
+    def record(self, event, handler, elapsed, failed=False):
+        """
+        Records a single invocation of handler, which took elapsed seconds.
+        """
+        key = (event, handler)
+        with self.__lock:
+            stats = self.__stats.get(key)
+            if stats is None:
+                stats = HandlerStats()
+                self.__stats.put(key, stats)
+            stats.add(elapsed, failed)
+
+    def snapshot(self, event=None):
+        """
+        Returns a list of HandlerSnapshot tuples, one for each handler and
+        event combination, ordered by event and then by priority. If event
+        is given, only the statistics for that event are returned.
+        """
+        with self.__lock:
+            items = [(key, stats.copy())
+                     for key, stats in self.__stats.items()
+                     if event is None or key[0] == event]
+        results = []
+        for (event_name, handler), stats in items:
+            results.append(HandlerSnapshot(
+                event=event_name,
+                handler=handler,
+                name=_callback_name(handler.callback),
+                priority=handler.priority,
+                calls=stats.calls,
+                errors=stats.errors,
+                total_time=stats.total_time,
+                mean=stats.total_time / stats.calls if stats.calls else 0.0,
+                p50=stats.percentile(50),
+                p90=stats.percentile(90),
+                p99=stats.percentile(99),
+                max_time=stats.max_time))
+        results.sort(key=lambda s: (s.event, s.priority))
+        return results
+
+    def reset(self):
+        """
+        Discards all statistics collected so far.
+        """
+        with self.__lock:
+            self.__stats.clear()
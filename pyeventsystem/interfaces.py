@@ -137,6 +137,30 @@ class EventDispatcher(object):
         """
         pass  # pragma: no cover
 
+    def subscribe_many(self, event_handlers):
+        """
+        Register multiple event handlers with this dispatcher. This is
+        equivalent to calling `subscribe` for each handler, but allows
+        dispatchers to update their internal state once for the whole batch.
+
+        :type event_handlers: list of :class:`.EventHandler`
+        :param event_handlers: The event handlers to subscribe.
+        """
+        for event_handler in event_handlers:
+            self.subscribe(event_handler)
+
+    def unsubscribe_many(self, event_handlers):
+        """
+        Unregister multiple event handlers from this dispatcher. This is
+        equivalent to calling `unsubscribe` for each handler, but allows
+        dispatchers to update their internal state once for the whole batch.
+
+        :type event_handlers: list of :class:`.EventHandler`
+        :param event_handlers: The event handlers to unsubscribe.
+        """
+        for event_handler in event_handlers:
+            self.unsubscribe(event_handler)
+
     @abstractmethod
     def get_handlers_for_event(self, event):
         """
@@ -153,6 +177,9 @@ class EventHandler(object):
 
     __metaclass__ = ABCMeta
 
+    # Allows implementations to define compact, __slots__ based handlers
+    __slots__ = ()
+
     @abstractproperty
     def event_pattern(self):
         """
@@ -310,3 +337,11 @@ class HandlerException(Exception):
     Marker interface for event handler exceptions.
     """
     pass  # pragma: no cover
+
+
+class UnhandledEventException(HandlerException):
+    """
+    Raised when an event without any subscribed handlers is dispatched, if
+    the dispatcher is configured to treat unhandled events as errors.
+    """
+    pass  # pragma: no cover
@@ -0,0 +1,188 @@
+import logging
+import os
+import pickle
+import queue
+import threading
+from collections import namedtuple
+
+from .events import ObservingEventHandler
+from .events import SimpleEventDispatcher
+from .middleware import BaseMiddleware
+
+log = logging.getLogger(__name__)
+
+# Identifies the object which raised a forwarded event, in the process which
+# raised it. Forwarded events are dispatched with a RemoteSender as the
+# sender.
+RemoteSender = namedtuple('RemoteSender', ['pid', 'sender_id'])
+
+
+class EventForwarder(BaseMiddleware):
+    """
+    Middleware which forwards events matching a set of patterns to an
+    EventCollector in another process. Events are observed at the given
+    priority, and are sent over the transport in batches, each pickled as a
+    single message of the form:
+
+        (pid, [(event, sender_id, args, kwargs), ...])
+
+    The transport may be any object with a `put` method, such as a
+    `multiprocessing.Queue`. A batch is sent when it reaches `batch_size`
+    events, when `flush` is called, when the middleware is uninstalled and,
+    if `flush_interval` is set, at least every `flush_interval` seconds.
+    Event arguments must be picklable. Events whose arguments are not are
+    logged and dropped.
+    """
+
+    def __init__(self, transport, event_patterns, priority, batch_size=100,
+                 flush_interval=None):
+        super(EventForwarder, self).__init__()
+        self.transport = transport
+        self.event_patterns = list(event_patterns)
+        self.priority = priority
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.__batch = []
+        self.__lock = threading.Lock()
+        self.__stopped = threading.Event()
+        self.__flusher = None
+
+    def install(self, event_manager):
+        super(EventForwarder, self).install(event_manager)
+        self.add_handlers([ObservingEventHandler(pattern, self.priority,
+                                                 self._forward)
+                           for pattern in self.event_patterns])
+        if self.flush_interval:
+            self.__stopped.clear()
+            self.__flusher = threading.Thread(
+                target=self._flush_periodically, name="EventForwarder")
+            self.__flusher.daemon = True
+            self.__flusher.start()
+
+    def uninstall(self):
+        super(EventForwarder, self).uninstall()
+        if self.__flusher:
+            self.__stopped.set()
+            self.__flusher.join()
+            self.__flusher = None
+        self.flush()
+
+    def _forward(self, event_args, *args, **kwargs):
+        item = (event_args['event'], id(event_args['sender']), args, kwargs)
+        with self.__lock:
+            self.__batch.append(item)
+            if len(self.__batch) < self.batch_size:
+                return
+            batch = self.__batch
+            self.__batch = []
+        self._send(batch)
+
+    def _flush_periodically(self):
+        while not self.__stopped.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """
+        Sends any events which have not been sent yet.
+        """
+        with self.__lock:
+            batch = self.__batch
+            self.__batch = []
+        if batch:
+            self._send(batch)
+
+    def _send(self, batch):
+        try:
+            message = pickle.dumps((os.getpid(), batch),
+                                   pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            # Find and drop the events which cannot be pickled, rather than
+            # losing the whole batch
+            picklable = []
+            for item in batch:
+                try:
+                    pickle.dumps(item, pickle.HIGHEST_PROTOCOL)
+                    picklable.append(item)
+                except Exception:
+                    log.exception("Cannot forward event '%s', since its "
+                                  "arguments cannot be pickled.", item[0])
+            if not picklable:
+                return
+            message = pickle.dumps((os.getpid(), picklable),
+                                   pickle.HIGHEST_PROTOCOL)
+        self.transport.put(message)
+
+
+class EventCollector(object):
+    """
+    Receives the events sent by EventForwarders in other processes, and
+    dispatches them to the observers registered with the collector. Each
+    event is dispatched with a RemoteSender, identifying the process and
+    object which raised it, as the sender.
+
+    The transport may be any object with a `get` method, such as a
+    `multiprocessing.Queue`. Call `start` to receive events on a background
+    thread, or `receive` to process messages on the calling thread.
+    """
+
+    def __init__(self, transport, dispatcher=None):
+        self.transport = transport
+        # Events are only received if an EventForwarder selected them, so
+        # events without observers are expected
+        self.events = dispatcher or SimpleEventDispatcher(
+            unhandled_policy=SimpleEventDispatcher.IGNORE)
+        self.__receiver = None
+
+    def observe(self, event_pattern, priority, callback):
+        """
+        Observe a forwarded event, in the same way as
+        `SimpleEventDispatcher.observe`.
+        """
+        return self.events.observe(event_pattern, priority, callback)
+
+    def receive(self, timeout=None):
+        """
+        Waits for a single message from the transport, and dispatches the
+        events it contains. Returns False if the collector was stopped, and
+        True otherwise, including when no message arrived within `timeout`
+        seconds.
+        """
+        try:
+            message = self.transport.get(timeout=timeout)
+        except queue.Empty:
+            return True
+        if message is None:
+            return False
+        pid, batch = pickle.loads(message)
+        for event, sender_id, args, kwargs in batch:
+            try:
+                self.events.dispatch(RemoteSender(pid, sender_id), event,
+                                     *args, **kwargs)
+            except Exception:
+                log.exception("Observer of forwarded event '%s' raised an "
+                              "exception", event)
+        return True
+
+    def _receive_forever(self):
+        while self.receive():
+            pass
+
+    def start(self):
+        """
+        Starts receiving events on a background thread.
+        """
+        self.__receiver = threading.Thread(target=self._receive_forever,
+                                           name="EventCollector")
+        self.__receiver.daemon = True
+        self.__receiver.start()
+
+    def stop(self):
+        """
+        Stops the background thread once all messages which were sent before
+        calling stop have been received.
+        """
+        # Wakes up the receiving thread
+        self.transport.put(None)
+        if self.__receiver:
+            self.__receiver.join()
+            self.__receiver = None
@@ -1,7 +1,16 @@
+import asyncio
+import fnmatch
 import functools
 import inspect
 import logging
+import operator
+import threading
+import time
+import weakref
+from collections import namedtuple
+from collections.abc import Iterator
 
+from .cache import LRUCache
 from .events import ImplementingEventHandler
 from .events import InterceptingEventHandler
 from .events import ObservingEventHandler
@@ -10,65 +19,86 @@ from .events import SimpleEventDispatcher
 from .interfaces import HandlerException
 from .interfaces import Middleware
 from .interfaces import MiddlewareManager
+from .patterns import compile_patterns
+from .patterns import covering_pattern
 
 log = logging.getLogger(__name__)
 
 
-def intercept(event_pattern, priority):
+def intercept(event_pattern, priority, sender_type=None, match=None):
     def deco(f):
         # Mark function as having an event_handler so we can discover it
         # The callback cannot be set to f as it is not bound yet and will be
         # set during auto discovery
         f.__event_handler = PlaceHoldingEventHandler(
-            event_pattern, priority, f, InterceptingEventHandler)
+            event_pattern, priority, f, InterceptingEventHandler,
+            sender_type, match)
         return f
     return deco
 
 
-def observe(event_pattern, priority):
+def observe(event_pattern, priority, sender_type=None, match=None):
     def deco(f):
         # Mark function as having an event_handler so we can discover it
         # The callback cannot be set to f as it is not bound yet and will be
         # set during auto discovery
         f.__event_handler = PlaceHoldingEventHandler(
-            event_pattern, priority, f, ObservingEventHandler)
+            event_pattern, priority, f, ObservingEventHandler,
+            sender_type, match)
         return f
     return deco
 
 
-def implement(event_pattern, priority):
+def implement(event_pattern, priority, sender_type=None, match=None,
+              stream=False):
     def deco(f):
         # Mark function as having an event_handler so we can discover it
         # The callback will be unbound since we do not have access to `self`
         # yet, and must be bound before invocation. This binding is done
         # during middleware auto discovery
         f.__event_handler = PlaceHoldingEventHandler(
-            event_pattern, priority, f, ImplementingEventHandler)
+            event_pattern, priority, f, ImplementingEventHandler,
+            sender_type, match, stream)
         return f
     return deco
 
 
-def _deepgetattr(obj, name, default=None):
-    """Recurses through an attribute chain to get the ultimate value."""
-    try:
-        return functools.reduce(getattr, name.split('.'), obj)
-    except AttributeError:
-        return default
+def _is_dispatched(dispatcher, event, obj, func):
+    """
+    Returns whether func, bound to obj, is subscribed to the given event.
+    """
+    if isinstance(dispatcher, SimpleEventDispatcher):
+        # The chain caches the set of bound callbacks it contains, and is
+        # replaced whenever the subscriptions for the event change
+        return dispatcher.get_chain_for_event(event).has_bound_callback(
+            obj, func)
+    bound_func = func.__get__(obj)
+    return any(h for h in dispatcher.get_handlers_for_event(event)
+               if h.callback == bound_func)
 
 
-def dispatch(event, priority, dispatcher_attr='events'):
+def dispatch(event, priority, dispatcher_attr='events', sender_type=None,
+             match=None, stream=False):
     """
     The event decorator combines the functionality of the implement decorator
     and a manual event dispatch into a single decorator.
     """
+    # Resolves a possibly dotted attribute chain to the dispatcher
+    get_dispatcher = operator.attrgetter(dispatcher_attr or 'events')
+
     def deco(f):
+        # Marks the handlers of f as being bound to the object which
+        # dispatches the event, so that they are not frozen into templates
+        f.__dispatched_event = event
+
         @functools.wraps(f)
         def wrapper(self, *args, **kwargs):
-            dispatcher = _deepgetattr(self, dispatcher_attr, default=None)
+            try:
+                dispatcher = get_dispatcher(self)
+            except AttributeError:
+                dispatcher = None
             if dispatcher:
-                bound_func = f.__get__(self)
-                if any(h for h in dispatcher.get_handlers_for_event(event)
-                       if h.callback == bound_func):
+                if _is_dispatched(dispatcher, event, self, f):
                     # This function is in the dispatcher list for this event,
                     # so dispatch it
                     return dispatcher.dispatch(self, event, *args, **kwargs)
@@ -87,11 +117,76 @@ def dispatch(event, priority, dispatcher_attr='events'):
         # The callback f is unbound and will be bound during middleware
         # auto discovery
         wrapper.__event_handler = PlaceHoldingEventHandler(
-            event, priority, f, ImplementingEventHandler)
+            event, priority, f, ImplementingEventHandler, sender_type, match,
+            stream)
         return wrapper
     return deco
 
 
+def _find_placeholders(class_or_obj):
+    """
+    Returns the PlaceHoldingEventHandlers of all methods of class_or_obj.
+    """
+
+    # https://bugs.python.org/issue30533
+    # simulating a getmembers_static to be easily replaced with the
+    # function if they add it to inspect module
+    def getmembers_static(obj, predicate=None):
+        results = []
+        for key in dir(obj):
+            if not inspect.isdatadescriptor(getattr(obj.__class__,
+                                                    key,
+                                                    None)):
+                try:
+                    value = getattr(obj, key)
+                except AttributeError:  # pragma: no cover
+                    continue
+                if not predicate or predicate(value):
+                    results.append((key, value))
+        return results
+
+    placeholders = []
+    for _, func in getmembers_static(class_or_obj, inspect.ismethod):
+        handler = getattr(func, "__event_handler", None)
+        if handler and isinstance(handler, PlaceHoldingEventHandler):
+            placeholders.append(handler)
+    return placeholders
+
+
+# The PlaceHoldingEventHandlers of each class, in the order in which they are
+# discovered on instances of the class
+_class_placeholders = weakref.WeakKeyDictionary()
+
+
+def _get_class_placeholders(cls):
+    """
+    Returns the PlaceHoldingEventHandlers of the methods that instances of
+    cls have. Class attributes are read statically, without invoking
+    descriptors, and the result is cached for the lifetime of the class.
+    Decorated methods added to the class after its first instance was
+    discovered are therefore not picked up.
+    """
+    placeholders = _class_placeholders.get(cls)
+    if placeholders is None:
+        placeholders = []
+        for key in dir(cls):
+            try:
+                value = inspect.getattr_static(cls, key)
+            except AttributeError:  # pragma: no cover
+                continue
+            # Only plain functions and classmethods are methods of instances
+            if isinstance(value, classmethod):
+                value = value.__func__
+            elif not inspect.isfunction(value):
+                continue
+            handler = getattr(value, "__event_handler", None)
+            if handler and isinstance(handler, PlaceHoldingEventHandler):
+                placeholders.append(handler)
+        placeholders = tuple(placeholders)
+        _class_placeholders[cls] = placeholders
+    return placeholders
+
+
 class SimpleMiddlewareManager(MiddlewareManager):
 
     def __init__(self, event_manager=None):
@@ -131,54 +226,51 @@ class BaseMiddleware(Middleware):
         if not hasattr(self, "event_handlers"):
             # In case the user forgot to call super class init
             self.event_handlers = []
-        for handler in handlers:
-            self.events.subscribe(handler)
+        self.events.subscribe_many(handlers)
         self.event_handlers.extend(handlers)
 
     def uninstall(self):
+        # Unsubscribe handlers in a single batch per dispatcher, skipping
+        # handlers which have already been unsubscribed
+        subscribed = {}
         for handler in self.event_handlers:
-            handler.unsubscribe()
+            if handler.dispatcher:
+                subscribed.setdefault(handler.dispatcher, []).append(handler)
+        for dispatcher, handlers in subscribed.items():
+            dispatcher.unsubscribe_many(handlers)
         self.event_handlers = []
         self.events = None
 
     @staticmethod
     def discover_handlers(class_or_obj):
-
-        # https://bugs.python.org/issue30533
-        # simulating a getmembers_static to be easily replaced with the
-        # function if they add it to inspect module
-        def getmembers_static(obj, predicate=None):
-            results = []
-            for key in dir(obj):
-                if not inspect.isdatadescriptor(getattr(obj.__class__,
-                                                        key,
-                                                        None)):
-                    try:
-                        value = getattr(obj, key)
-                    except AttributeError:  # pragma: no cover
-                        continue
-                    if not predicate or predicate(value):
-                        results.append((key, value))
-            return results
+        if inspect.isclass(class_or_obj):
+            placeholders = _find_placeholders(class_or_obj)
+        else:
+            # The handlers of an object are discovered once per class, and
+            # only need to be bound to the object
+            placeholders = _get_class_placeholders(type(class_or_obj))
 
         discovered_handlers = []
-        for _, func in getmembers_static(class_or_obj, inspect.ismethod):
-            handler = getattr(func, "__event_handler", None)
-            if handler and isinstance(handler, PlaceHoldingEventHandler):
-                # create a new handler that mimics the original one,
-                # essentially deep-copying the handler, so that the bound
-                # method is never stored in the function itself, preventing
-                # further bonding
-                new_handler = handler.handler_class(handler.event_pattern,
-                                                    handler.priority,
-                                                    handler.callback)
-                # Bind the currently unbound method
-                # and set the bound method as the callback
-                new_handler.callback = (new_handler.callback
-                                                   .__get__(class_or_obj))
-                # Mark old handler as bound
-                handler._is_bound = True
-                discovered_handlers.append(new_handler)
+        for handler in placeholders:
+            # create a new handler that mimics the original one,
+            # essentially deep-copying the handler, so that the bound
+            # method is never stored in the function itself, preventing
+            # further bonding. The currently unbound method is bound and set
+            # as the callback.
+            # Only pass the options which were set, which custom handler
+            # classes need not support
+            options = {}
+            if handler.sender_type is not None or handler.match:
+                options = {'sender_type': handler.sender_type,
+                           'match': handler.match}
+            if handler.stream:
+                options['stream'] = True
+            new_handler = handler.handler_class(
+                handler.event_pattern, handler.priority,
+                handler.callback.__get__(class_or_obj), **options)
+            # Mark old handler as bound
+            handler._is_bound = True
+            discovered_handlers.append(new_handler)
         return discovered_handlers
 
 
@@ -192,3 +284,388 @@ class AutoDiscoveredMiddleware(BaseMiddleware):
         super(AutoDiscoveredMiddleware, self).install(event_manager)
         discovered_handlers = self.discover_handlers(self.obj_to_discover)
         self.add_handlers(discovered_handlers)
+
+
+def _pattern_filter(patterns):
+    """
+    Returns the pattern to subscribe a single handler for a set of patterns
+    to, since handlers for overlapping patterns at the same priority would
+    conflict. Also returns a function which tests whether an event matches
+    any of the patterns, or None if all events matching the subscribed
+    pattern do.
+    """
+    pattern = covering_pattern(patterns)
+    if pattern in patterns:
+        return pattern, None
+    return pattern, compile_patterns(patterns)
+
+
+ResultCacheInfo = namedtuple('ResultCacheInfo', [
+    'hits', 'misses', 'hit_rate', 'evictions', 'expirations', 'invalidations',
+    'maxsize', 'currsize'])
+
+
+class _Unhashable(Exception):
+    pass
+
+
+# Marks a miss whose result should not be cached
+_NOT_CACHED = object()
+
+
+def _normalize(value):
+    """
+    Converts value into a hashable equivalent, for use in a cache key.
+    Raises _Unhashable if that is not possible.
+
+    The type of each value is part of its key, so that values which compare
+    equal but differ in type, such as 1 and True, or [1] and (1,), are not
+    confused.
+    """
+    if isinstance(value, (list, tuple)):
+        return (type(value), tuple(_normalize(v) for v in value))
+    elif isinstance(value, dict):
+        try:
+            items = sorted(value.items(), key=lambda item: item[0])
+        except TypeError:
+            # The keys are not mutually orderable
+            raise _Unhashable()
+        return (type(value), tuple((_normalize(k), _normalize(v))
+                                   for k, v in items))
+    elif isinstance(value, (set, frozenset)):
+        return (type(value), frozenset(_normalize(v) for v in value))
+    try:
+        hash(value)
+    except TypeError:
+        raise _Unhashable()
+    return (type(value), value)
+
+
+def _dispatch_key(event_args, args, kwargs):
+    """
+    Returns a key identifying the event, sender and arguments of a dispatch.
+    """
+    return (event_args['event'], _normalize(event_args['sender']),
+            _normalize(args), _normalize(kwargs))
+
+
+class CachingMiddleware(BaseMiddleware):
+    """
+    Memoizes the results of events matching a set of patterns, typically
+    idempotent reads such as listing regions. The middleware intercepts the
+    events at the given priority, and returns cached results without
+    invoking the remainder of the chain. Results are keyed on the event
+    name, the sender and the normalized arguments of the dispatch. Calls
+    with arguments that cannot be hashed are not cached, and neither are
+    exceptions or results which are iterators.
+
+    At most `maxsize` results are kept, with the least recently used results
+    evicted first. If `ttl` is set, results expire `ttl` seconds after they
+    were cached.
+
+    `invalidated_by` maps event patterns to the cached event patterns which
+    they invalidate. e.g. {"*.create": ["*.list"]} discards all cached list
+    results whenever an object is created. The invalidating events are
+    observed at `invalidation_priority`, which defaults to one less than
+    `priority`, so that an event which is both cached and invalidating
+    invalidates the cache before it is read.
+    Results which were being computed when their event was invalidated are
+    not cached.
+
+    Works with both SimpleEventDispatcher and AsyncEventDispatcher.
+    """
+
+    def __init__(self, event_patterns, priority, maxsize=128, ttl=None,
+                 invalidated_by=None, invalidation_priority=None,
+                 clock=time.monotonic):
+        super(CachingMiddleware, self).__init__()
+        self.event_patterns = list(event_patterns)
+        self.priority = priority
+        self.ttl = ttl
+        self.invalidated_by = dict(invalidated_by or {})
+        self.invalidation_priority = (
+            priority - 1 if invalidation_priority is None
+            else invalidation_priority)
+        self.clock = clock
+        self.__results = LRUCache(maxsize)
+        # The cache keys of the results of each event
+        self.__event_keys = {}
+        # The number of misses in progress for each event, and its
+        # generation, which is advanced whenever the event is invalidated
+        self.__in_flight = {}
+        self.__lock = threading.Lock()
+        self.__hits = 0
+        self.__misses = 0
+        self.__expirations = 0
+        self.__invalidations = 0
+        self.__is_cached = None
+
+    def install(self, event_manager):
+        super(CachingMiddleware, self).install(event_manager)
+        handlers = []
+        if self.event_patterns:
+            pattern, self.__is_cached = _pattern_filter(self.event_patterns)
+            handlers.append(InterceptingEventHandler(pattern, self.priority,
+                                                     self._intercept))
+        if self.invalidated_by:
+            pattern, _ = _pattern_filter(list(self.invalidated_by))
+            handlers.append(ObservingEventHandler(
+                pattern, self.invalidation_priority, self._invalidate))
+        self.add_handlers(handlers)
+
+    def _intercept(self, event_args, *args, **kwargs):
+        next_handler = event_args.get('next_handler')
+        if not next_handler:
+            # There is no result to cache
+            return None
+        if self.__is_cached and not self.__is_cached(event_args['event']):
+            return next_handler.invoke(event_args, *args, **kwargs)
+        try:
+            key = _dispatch_key(event_args, args, kwargs)
+        except _Unhashable:
+            return next_handler.invoke(event_args, *args, **kwargs)
+        with self.__lock:
+            entry = self.__results.get(key)
+            if entry is not None:
+                expires, result = entry
+                if expires is None or self.clock() < expires:
+                    self.__hits += 1
+                    return result
+                self.__expirations += 1
+                self._discard(key)
+            self.__misses += 1
+            flight = self.__in_flight.setdefault(key[0], [0, 0])
+            flight[0] += 1
+            generation = flight[1]
+        try:
+            result = next_handler.invoke(event_args, *args, **kwargs)
+        except BaseException:
+            self._store(key, generation)
+            raise
+        if inspect.isawaitable(result):
+            return self._store_awaited(key, generation, result)
+        self._store(key, generation, result)
+        return result
+
+    async def _store_awaited(self, key, generation, awaitable):
+        try:
+            result = await awaitable
+        except BaseException:
+            self._store(key, generation)
+            raise
+        self._store(key, generation, result)
+        return result
+
+    def _store(self, key, generation, result=_NOT_CACHED):
+        """
+        Completes a miss on key, which started at the given generation of
+        its event, caching its result unless the event was invalidated in
+        the meantime.
+        """
+        if isinstance(result, Iterator):
+            # Iterators can only be consumed once
+            result = _NOT_CACHED
+        expires = self.clock() + self.ttl if self.ttl is not None else None
+        with self.__lock:
+            flight = self.__in_flight[key[0]]
+            flight[0] -= 1
+            if not flight[0]:
+                del self.__in_flight[key[0]]
+            if result is _NOT_CACHED or flight[1] != generation:
+                return
+            evicted = self.__results.put(key, (expires, result))
+            self.__event_keys.setdefault(key[0], set()).add(key)
+            if evicted:
+                self._forget_key(evicted[0])
+
+    def _discard(self, key):
+        self.__results.pop(key)
+        self._forget_key(key)
+
+    def _forget_key(self, key):
+        keys = self.__event_keys.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.__event_keys[key[0]]
+
+    def _invalidate(self, event_args, *args, **kwargs):
+        patterns = [cached for pattern, cached_patterns
+                    in self.invalidated_by.items()
+                    if fnmatch.fnmatchcase(event_args['event'], pattern)
+                    for cached in cached_patterns]
+        if patterns:
+            self.invalidate(*patterns)
+
+    def invalidate(self, *event_patterns):
+        """
+        Discards the cached results of all events matching any of the given
+        patterns, or all cached results if no patterns are given.
+        """
+        def matches(event):
+            return not event_patterns or any(
+                fnmatch.fnmatchcase(event, pattern)
+                for pattern in event_patterns)
+
+        with self.__lock:
+            for event, flight in self.__in_flight.items():
+                if matches(event):
+                    flight[1] += 1
+            for event in list(self.__event_keys):
+                if matches(event):
+                    for key in self.__event_keys.pop(event):
+                        self.__results.pop(key)
+                        self.__invalidations += 1
+
+    def cache_info(self):
+        """
+        Returns the hit and miss counts, the hit rate, and the number of
+        results evicted, expired and invalidated, along with the maximum and
+        current size of the cache, as a named tuple.
+        """
+        with self.__lock:
+            info = self.__results.info()
+            lookups = self.__hits + self.__misses
+            return ResultCacheInfo(
+                self.__hits, self.__misses,
+                self.__hits / float(lookups) if lookups else 0.0,
+                info.evictions, self.__expirations, self.__invalidations,
+                info.maxsize, info.currsize)
+
+
+class _Flight(object):
+
+    __slots__ = ('owner', 'done', 'result', 'exception')
+
+    def __init__(self):
+        self.owner = threading.get_ident()
+        self.done = threading.Event()
+        self.result = None
+        self.exception = None
+
+
+class SingleFlightMiddleware(BaseMiddleware):
+    """
+    Coalesces concurrent dispatches of the same event, by the same sender and
+    with the same arguments, into a single invocation of the handler chain.
+    The middleware intercepts the events matching a set of patterns at the
+    given priority. The first caller runs the remainder of the chain, and
+    any identical dispatches made before it completes wait for it, and share
+    its result or exception. Dispatches with arguments that cannot be hashed
+    are never coalesced, and iterators, which can only be consumed once, are
+    not shared. Callers which waited for an iterator run the chain
+    themselves.
+
+    With a SimpleEventDispatcher, duplicate callers block until the first
+    caller's thread completes. With an AsyncEventDispatcher, duplicate
+    callers await the first caller's result, in the same event loop.
+    Cancelling the first caller cancels the duplicates too.
+    """
+
+    def __init__(self, event_patterns, priority):
+        super(SingleFlightMiddleware, self).__init__()
+        self.event_patterns = list(event_patterns)
+        self.priority = priority
+        # The number of dispatches which shared the result of another
+        self.coalesced = 0
+        self.__flights = {}
+        self.__lock = threading.Lock()
+        self.__is_coalesced = None
+
+    def install(self, event_manager):
+        super(SingleFlightMiddleware, self).install(event_manager)
+        if self.event_patterns:
+            pattern, self.__is_coalesced = _pattern_filter(
+                self.event_patterns)
+            self.add_handlers([InterceptingEventHandler(
+                pattern, self.priority, self._intercept)])
+
+    def _intercept(self, event_args, *args, **kwargs):
+        next_handler = event_args.get('next_handler')
+        if not next_handler:
+            # There is nothing to coalesce
+            return None
+        if (self.__is_coalesced and
+                not self.__is_coalesced(event_args['event'])):
+            return next_handler.invoke(event_args, *args, **kwargs)
+        try:
+            key = _dispatch_key(event_args, args, kwargs)
+        except _Unhashable:
+            return next_handler.invoke(event_args, *args, **kwargs)
+        if inspect.iscoroutinefunction(next_handler.invoke):
+            return self._intercept_async(key, event_args, args, kwargs)
+        leader = False
+        with self.__lock:
+            flight = self.__flights.get(key)
+            if flight is None:
+                flight = self.__flights[key] = _Flight()
+                leader = True
+            elif flight.owner == threading.get_ident():
+                # A re-entrant dispatch would wait for itself
+                flight = None
+            else:
+                self.coalesced += 1
+        if flight is None:
+            return next_handler.invoke(event_args, *args, **kwargs)
+        if not leader:
+            flight.done.wait()
+            if (flight.exception is None and
+                    isinstance(flight.result, Iterator)):
+                return self._run_uncoalesced(next_handler, event_args, args,
+                                             kwargs)
+            if flight.exception is not None:
+                raise flight.exception
+            return flight.result
+        try:
+            flight.result = next_handler.invoke(event_args, *args, **kwargs)
+            return flight.result
+        except Exception as e:
+            flight.exception = e
+            raise
+        finally:
+            with self.__lock:
+                del self.__flights[key]
+            flight.done.set()
+
+    def _run_uncoalesced(self, next_handler, event_args, args, kwargs):
+        # Iterators can only be consumed once, so the caller which waited for
+        # one gets its own
+        with self.__lock:
+            self.coalesced -= 1
+        return next_handler.invoke(event_args, *args, **kwargs)
+
+    async def _intercept_async(self, key, event_args, args, kwargs):
+        loop = asyncio.get_running_loop()
+        key = (loop,) + key
+        with self.__lock:
+            future = self.__flights.get(key)
+            if future is None:
+                future = self.__flights[key] = loop.create_future()
+                leader = True
+            else:
+                leader = False
+                self.coalesced += 1
+        next_handler = event_args['next_handler']
+        if not leader:
+            # Cancelling a duplicate caller must not cancel the others
+            result = await asyncio.shield(future)
+            if isinstance(result, Iterator):
+                return await self._run_uncoalesced(next_handler, event_args,
+                                                   args, kwargs)
+            return result
+        try:
+            result = await next_handler.invoke(event_args, *args, **kwargs)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Marks the exception as retrieved, in case there were no
+            # duplicate callers
+            future.exception()
+            raise
+        finally:
+            with self.__lock:
+                del self.__flights[key]
@@ -0,0 +1,207 @@
+import fnmatch
+import itertools
+import os
+import re
+
+# Characters that give an event pattern glob semantics
+_GLOB_CHARS = re.compile(r'[*?[]')
+_SET_OR_GLOB_CHARS = re.compile(r'[*?[\]]')
+
+# The kinds of pattern stored in the index
+_EXACT = 'exact'
+_STAR = 'star'
+_GLOB = 'glob'
+
+
+def is_glob(pattern):
+    return _GLOB_CHARS.search(pattern) is not None
+
+
+def _literal_prefix(pattern):
+    # Also stops at the end of a character set, when pattern is reversed
+    match = _SET_OR_GLOB_CHARS.search(pattern)
+    return pattern[:match.start()] if match else pattern
+
+
+def covering_pattern(patterns):
+    """
+    Returns a single pattern which matches every event matched by any of
+    the given patterns. The pattern is made up of the literal prefix and
+    suffix shared by all of the patterns, with a wildcard in between, e.g.
+    provider.compute.*.list and provider.storage.*.list are covered by
+    provider.*.list. A single pattern is returned unchanged.
+    """
+    patterns = list(patterns)
+    if len(set(patterns)) == 1:
+        return patterns[0]
+    prefix = os.path.commonprefix([_literal_prefix(p) for p in patterns])
+    # The suffixes may not overlap the prefix of the shortest pattern
+    rests = [p[len(prefix):][::-1] for p in patterns]
+    suffix = os.path.commonprefix([_literal_prefix(r) for r in rests])[::-1]
+    return prefix + '*' + suffix
+
+
+def compile_patterns(patterns):
+    """
+    Returns a function which tests whether an event matches any of the
+    given patterns.
+    """
+    regex = re.compile('|'.join(fnmatch.translate(p) for p in patterns))
+    return lambda event: regex.match(event) is not None
+
+
+class _PatternNode(object):
+
+    __slots__ = ('children', 'star', 'globs')
+
+    def __init__(self):
+        # Child nodes keyed by the next literal segment of the pattern
+        self.children = {}
+        # A pattern consisting of the literal segments leading to this node,
+        # followed by a trailing wildcard, e.g. provider.storage.*
+        self.star = None
+        # All other patterns whose leading literal segments lead to this
+        # node. The dict value is a precompiled match function.
+        self.globs = {}
+
+    def copy(self):
+        node = _PatternNode()
+        node.children = dict(self.children)
+        node.star = self.star
+        node.globs = dict(self.globs)
+        return node
+
+    def is_empty(self):
+        return not (self.children or self.globs or self.star)
+
+
+class PatternIndex(object):
+    """
+    Indexes event patterns so that the patterns matching a given event can
+    be found without testing every pattern. Literal event names are kept in
+    a set, and are matched with a single lookup. Wildcard patterns are kept
+    in a trie keyed on the dot separated segments of each pattern, which is
+    walked along the segments of the event name.
+
+    Patterns consisting of a literal prefix followed by a trailing `.*` are
+    matched purely through the trie. Any other glob is stored against its
+    leading literal segments along with a precompiled regex, which is only
+    evaluated when an event shares that prefix.
+
+    Matching follows :func:`fnmatch.fnmatchcase` semantics, which means that
+    a `*` may span multiple segments, e.g. `provider.*` matches
+    `provider.storage.buckets.list`.
+
+    Nodes are never modified once they are part of the trie. Adding or
+    removing a pattern copies the nodes along its path instead, so `copy()`
+    is cheap, and a copy can be modified while other threads are matching
+    against the original.
+    """
+
+    def __init__(self):
+        self._root = _PatternNode()
+        self._literals = set()
+        self._wildcards = set()
+
+    def copy(self):
+        index = PatternIndex()
+        index._root = self._root
+        index._literals = set(self._literals)
+        index._wildcards = set(self._wildcards)
+        return index
+
+    def __contains__(self, pattern):
+        return pattern in self._literals or pattern in self._wildcards
+
+    def __len__(self):
+        return len(self._literals) + len(self._wildcards)
+
+    def __iter__(self):
+        return itertools.chain(self._literals, self._wildcards)
+
+    @staticmethod
+    def _split(pattern):
+        """
+        Splits a pattern into its leading literal segments and the kind of
+        pattern it is, one of _EXACT, _STAR (a literal prefix followed by a
+        trailing wildcard) or _GLOB.
+        """
+        if pattern == '*':
+            return [], _STAR
+        segments = pattern.split('.')
+        for pos, segment in enumerate(segments):
+            if is_glob(segment):
+                if segment == '*' and pos == len(segments) - 1:
+                    return segments[:pos], _STAR
+                return segments[:pos], _GLOB
+        return segments, _EXACT
+
+    def add(self, pattern):
+        if pattern in self:
+            return
+        literals, kind = self._split(pattern)
+        if kind == _EXACT:
+            self._literals.add(pattern)
+            return
+        node = self._root = self._root.copy()
+        for segment in literals:
+            child = node.children.get(segment)
+            child = child.copy() if child else _PatternNode()
+            node.children[segment] = child
+            node = child
+        if kind == _STAR:
+            node.star = pattern
+        else:
+            node.globs[pattern] = re.compile(fnmatch.translate(pattern)).match
+        self._wildcards.add(pattern)
+
+    def remove(self, pattern):
+        if pattern in self._literals:
+            self._literals.discard(pattern)
+            return
+        if pattern not in self._wildcards:
+            return
+        literals, kind = self._split(pattern)
+        path = [self._root.copy()]
+        for segment in literals:
+            child = path[-1].children[segment].copy()
+            path[-1].children[segment] = child
+            path.append(child)
+        self._root = path[0]
+        node = path[-1]
+        if kind == _STAR:
+            node.star = None
+        else:
+            del node.globs[pattern]
+        self._wildcards.discard(pattern)
+        # prune nodes which no longer lead to any pattern
+        for segment, parent in zip(reversed(literals), reversed(path[:-1])):
+            if not parent.children[segment].is_empty():
+                break
+            del parent.children[segment]
+
+    def match(self, event):
+        """
+        Returns a list of all indexed patterns that match the given event.
+        """
+        matches = [event] if event in self._literals else []
+        if not self._wildcards:
+            return matches
+        node = self._root
+        if node.star:
+            matches.append(node.star)
+        for pattern, match in node.globs.items():
+            if match(event):
+                matches.append(pattern)
+        segments = event.split('.')
+        last = len(segments) - 1
+        for pos, segment in enumerate(segments):
+            node = node.children.get(segment)
+            if node is None:
+                break
+            if pos != last and node.star:
+                matches.append(node.star)
+            for pattern, match in node.globs.items():
+                if match(event):
+                    matches.append(pattern)
+        return matches
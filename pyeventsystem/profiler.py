@@ -0,0 +1,212 @@
+import contextvars
+import random
+from collections import deque
+from time import perf_counter as _clock
+from time import thread_time as _cpu_clock
+
+from .instrumentation import _callback_name
+
+# The span which is currently executing, in this thread or task
+_current_span = contextvars.ContextVar('pyeventsystem_current_span',
+                                       default=None)
+# Marks the context of a dispatch which was not selected for profiling
+_UNSAMPLED = object()
+
+
+class Span(object):
+    """
+    A single dispatch of an event, or invocation of a handler, along with
+    the dispatches and handlers which were executed within it. Times are in
+    seconds.
+    """
+
+    __slots__ = ('event', 'handler', 'parent', 'children', 'start',
+                 'wall_time', 'cpu_time', 'failed', '_cpu_start', '_token')
+
+    def __init__(self, event, handler, parent):
+        self.event = event
+        # The handler which was invoked, or None for the dispatch of event
+        self.handler = handler
+        self.parent = parent
+        self.children = []
+        self.start = _clock()
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.failed = False
+        self._cpu_start = _cpu_clock()
+        self._token = None
+
+    @property
+    def name(self):
+        if self.handler is None:
+            return self.event
+        return _callback_name(self.handler.callback)
+
+    @property
+    def self_wall_time(self):
+        return max(self.wall_time - sum(c.wall_time for c in self.children),
+                   0.0)
+
+    @property
+    def self_cpu_time(self):
+        return max(self.cpu_time - sum(c.cpu_time for c in self.children),
+                   0.0)
+
+
+def _frame_name(span):
+    # Semicolons separate the frames of a collapsed stack
+    return span.name.replace(';', ':')
+
+
+class DispatchProfiler(object):
+    """
+    Records a tree of spans for each profiled dispatch, covering the
+    dispatch of the event, each handler it invoked, and any events which
+    those handlers dispatched in turn, with the wall clock and CPU time of
+    each. Use it in place of an Instrumentation:
+
+        profiler = DispatchProfiler(sample_rate=0.1)
+        dispatcher = SimpleEventDispatcher(instrumentation=profiler)
+
+    Nested dispatches are only recorded if the dispatchers they go through
+    use the same profiler.
+
+    Only `sample_rate` of the top level dispatches are profiled, along with
+    everything nested within them. At most `max_spans` top level spans are
+    kept, with the oldest discarded first. The results can be exported in
+    the collapsed stack format read by flamegraph.pl and similar tools, or
+    as a speedscope profile.
+
+    Nesting is tracked through context variables, so it is followed across
+    threads and asyncio tasks, but not into observers run on an executor.
+    CPU time is measured for the thread, so spans which await include the
+    CPU time of other tasks run in the meantime, and concurrent observers
+    are recorded without CPU time.
+    """
+
+    def __init__(self, sample_rate=1.0, max_spans=10000):
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError("Sample rate must be between 0 and 1.")
+        self.sample_rate = sample_rate
+        self.__roots = deque(maxlen=max_spans)
+
+    def start(self, event, handler):
+        parent = _current_span.get()
+        if parent is _UNSAMPLED:
+            return None
+        if parent is None and self.sample_rate < 1.0:
+            if random.random() >= self.sample_rate:
+                return _current_span.set(_UNSAMPLED)
+        span = Span(event, handler, parent)
+        span._token = _current_span.set(span)
+        return span
+
+    def finish(self, event, handler, token, failed=False):
+        if token is None:
+            return
+        if not isinstance(token, Span):
+            # The dispatch was not sampled
+            _current_span.reset(token)
+            return
+        span = token
+        span.wall_time = _clock() - span.start
+        span.cpu_time = _cpu_clock() - span._cpu_start
+        span.failed = failed
+        _current_span.reset(span._token)
+        span._token = None
+        if span.parent is None:
+            self.__roots.append(span)
+        else:
+            span.parent.children.append(span)
+
+    def record(self, event, handler, elapsed, failed=False):
+        # Used for handlers which were not individually started, such as
+        # concurrent observers
+        parent = _current_span.get()
+        if not isinstance(parent, Span):
+            return
+        span = Span(event, handler, parent)
+        span.start -= elapsed
+        span.wall_time = elapsed
+        span.failed = failed
+        parent.children.append(span)
+
+    def spans(self):
+        """
+        Returns the top level spans recorded so far, oldest first.
+        """
+        return list(self.__roots)
+
+    def reset(self):
+        """
+        Discards all spans recorded so far.
+        """
+        self.__roots.clear()
+
+    def collapsed_stacks(self, cpu=False):
+        """
+        Returns a dict mapping each stack of span names, from the top level
+        span down, to the total self time spent in it, in seconds. Wall
+        clock time is used unless cpu is True.
+        """
+        stacks = {}
+        pending = [((_frame_name(root),), root) for root in self.spans()]
+        while pending:
+            stack, span = pending.pop()
+            elapsed = span.self_cpu_time if cpu else span.self_wall_time
+            stacks[stack] = stacks.get(stack, 0.0) + elapsed
+            pending.extend((stack + (_frame_name(child),), child)
+                           for child in span.children)
+        return stacks
+
+    def export_collapsed(self, cpu=False):
+        """
+        Returns the recorded spans in the collapsed stack format, with one
+        line per stack, and the self time spent in it in microseconds.
+        """
+        lines = []
+        for stack, elapsed in sorted(self.collapsed_stacks(cpu).items()):
+            micros = int(round(elapsed * 1e6))
+            if micros:
+                lines.append("{0} {1}".format(";".join(stack), micros))
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def export_speedscope(self, name="pyeventsystem"):
+        """
+        Returns the recorded spans as a speedscope profile, which can be
+        written out with json.dump. The profile contains one sampled
+        profile for wall clock time, and one for CPU time, in microseconds.
+        """
+        frames = []
+        frame_index = {}
+        profiles = []
+        for cpu in (False, True):
+            samples = []
+            weights = []
+            for stack, elapsed in sorted(self.collapsed_stacks(cpu).items()):
+                sample = []
+                for frame in stack:
+                    if frame not in frame_index:
+                        frame_index[frame] = len(frames)
+                        frames.append({'name': frame})
+                    sample.append(frame_index[frame])
+                samples.append(sample)
+                weights.append(elapsed * 1e6)
+            profiles.append({
+                'type': 'sampled',
+                'name': "{0} ({1})".format(name,
+                                           "CPU time" if cpu else "wall time"),
+                'unit': 'microseconds',
+                'startValue': 0,
+                'endValue': sum(weights),
+                'samples': samples,
+                'weights': weights,
+            })
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'shared': {'frames': frames},
+            'profiles': profiles,
+            'name': name,
+            'activeProfileIndex': 0,
+            'exporter': 'pyeventsystem',
+        }
@@ -0,0 +1,261 @@
+import asyncio
+import unittest
+
+from pyeventsystem.async_events import AsyncEventDispatcher
+from pyeventsystem.instrumentation import Instrumentation
+from pyeventsystem.middleware import CachingMiddleware
+from pyeventsystem.middleware import SimpleMiddlewareManager
+from pyeventsystem.middleware import SingleFlightMiddleware
+from pyeventsystem.middleware import dispatch
+from pyeventsystem.middleware import intercept
+from pyeventsystem.middleware import observe
+from pyeventsystem.profiler import DispatchProfiler
+
+
+class AsyncEventSystemTestCase(unittest.IsolatedAsyncioTestCase):
+
+    async def test_dispatch_no_handlers(self):
+        dispatcher = AsyncEventDispatcher()
+        result = await dispatcher.dispatch(self, "event.hello.world")
+        self.assertIsNone(result)
+
+    async def test_dispatch_mixed_chain(self):
+        EVENT_NAME = "event.hello.world"
+        callback_tracker = ['']
+
+        async def my_callback_intcpt(event_args, *args, **kwargs):
+            callback_tracker[0] += "intcpt_"
+            next_handler = event_args.get('next_handler')
+            result = await next_handler.invoke(event_args, *args, **kwargs)
+            return "hello" + result
+
+        def my_callback_obs(event_args, *args, **kwargs):
+            self.assertDictEqual(event_args, {'sender': self,
+                                              'event': EVENT_NAME})
+            callback_tracker[0] += "obs_"
+
+        async def my_callback_impl(*args, **kwargs):
+            self.assertSequenceEqual(args, ['first_pos_arg'])
+            self.assertDictEqual(kwargs, {'a_keyword_arg': 'another_thing'})
+            await asyncio.sleep(0)
+            callback_tracker[0] += "impl_"
+            return "world"
+
+        async def my_callback_post(event_args, *args, **kwargs):
+            self.assertEqual(event_args['result'], "world")
+            callback_tracker[0] += "post_"
+            return "ignored"
+
+        dispatcher = AsyncEventDispatcher()
+        dispatcher.intercept(EVENT_NAME, 1000, my_callback_intcpt)
+        dispatcher.observe(EVENT_NAME, 1001, my_callback_obs)
+        dispatcher.implement(EVENT_NAME, 1002, my_callback_impl)
+        dispatcher.observe(EVENT_NAME, 1003, my_callback_post)
+        result = await dispatcher.dispatch(self, EVENT_NAME, 'first_pos_arg',
+                                           a_keyword_arg='another_thing')
+        self.assertEqual(callback_tracker[0], "intcpt_obs_impl_post_")
+        self.assertEqual(result, "helloworld")
+
+    async def test_concurrent_observers(self):
+        EVENT_NAME = "event.hello.world"
+        callback_tracker = []
+        started = asyncio.Event()
+
+        async def my_callback_obs1(event_args, *args, **kwargs):
+            # Would block forever if observers were run sequentially
+            await started.wait()
+            callback_tracker.append("obs1")
+
+        async def my_callback_obs2(event_args, *args, **kwargs):
+            started.set()
+            callback_tracker.append("obs2")
+
+        def my_callback_impl(*args, **kwargs):
+            callback_tracker.append("impl")
+            return "world"
+
+        dispatcher = AsyncEventDispatcher()
+        dispatcher.observe(EVENT_NAME, 1000, my_callback_obs1,
+                           concurrent=True)
+        dispatcher.observe(EVENT_NAME, 1001, my_callback_obs2,
+                           concurrent=True)
+        dispatcher.implement(EVENT_NAME, 1002, my_callback_impl)
+        result = await asyncio.wait_for(
+            dispatcher.dispatch(self, EVENT_NAME), timeout=5)
+        self.assertEqual(result, "world")
+        self.assertListEqual(callback_tracker, ["obs2", "obs1", "impl"])
+
+    async def test_async_middleware(self):
+        EVENT_NAME = "some.event.occurred"
+        invocation_order = [""]
+
+        class SomeDummyClass(object):
+
+            def __init__(self, events):
+                self.events = events
+
+            @intercept(event_pattern="some.event.*", priority=900)
+            async def my_callback_intcpt(self, event_args, *args, **kwargs):
+                invocation_order[0] += "intcpt_"
+                next_handler = event_args.get('next_handler')
+                return await next_handler.invoke(event_args, *args, **kwargs)
+
+            @dispatch(event=EVENT_NAME, priority=2500)
+            async def my_callback_impl(self, name):
+                invocation_order[0] += "impl_"
+                return "hello " + name
+
+            @observe(event_pattern="some.event.*", priority=3000)
+            async def my_callback_obs(self, event_args, *args, **kwargs):
+                invocation_order[0] += "obs"
+
+        manager = SimpleMiddlewareManager(AsyncEventDispatcher())
+        obj = SomeDummyClass(manager.events)
+        middleware = manager.add(obj)
+        self.assertEqual(await obj.my_callback_impl("world"), "hello world")
+        self.assertEqual(invocation_order[0], "intcpt_impl_obs")
+
+        manager.remove(middleware)
+        invocation_order[0] = ""
+        self.assertEqual(await obj.my_callback_impl("world"), "hello world")
+        self.assertEqual(invocation_order[0], "impl_")
+
+    async def test_dispatch_many(self):
+        EVENT_NAME = "event.hello.world"
+        batches = []
+
+        async def my_callback_impl(value):
+            await asyncio.sleep(0)
+            return value * 2
+
+        async def my_callback_batch(event_args, batch):
+            batches.append((event_args.get('results'), batch))
+
+        dispatcher = AsyncEventDispatcher()
+        dispatcher.implement(EVENT_NAME, 1000, my_callback_impl)
+        dispatcher.observe_batch(EVENT_NAME, 1001, my_callback_batch)
+
+        results = await dispatcher.dispatch_many(self, EVENT_NAME, [1, 2])
+        self.assertEqual(results, [2, 4])
+        self.assertEqual(batches, [([2, 4], [((1,), {}), ((2,), {})])])
+
+        self.assertEqual(await dispatcher.dispatch(self, EVENT_NAME, 3), 6)
+        self.assertEqual(batches[-1], (None, [((3,), {})]))
+
+    async def test_instrumentation(self):
+        EVENT_NAME = "event.hello.world"
+
+        async def my_callback_obs(event_args, *args, **kwargs):
+            await asyncio.sleep(0)
+
+        async def my_callback_impl():
+            return "hello"
+
+        monitor = Instrumentation()
+        dispatcher = AsyncEventDispatcher(instrumentation=monitor)
+        dispatcher.observe(EVENT_NAME, 1000, my_callback_obs,
+                           concurrent=True)
+        dispatcher.observe(EVENT_NAME, 1001, my_callback_obs,
+                           concurrent=True)
+        dispatcher.implement(EVENT_NAME, 1002, my_callback_impl)
+
+        self.assertEqual(await dispatcher.dispatch(self, EVENT_NAME), "hello")
+        self.assertEqual([s.calls for s in monitor.snapshot()], [1, 1, 1])
+
+    async def test_derive_from_template(self):
+        EVENT_NAME = "event.hello.world"
+
+        async def my_callback_impl():
+            return "hello"
+
+        dispatcher = AsyncEventDispatcher()
+        dispatcher.implement(EVENT_NAME, 1000, my_callback_impl)
+        derived = dispatcher.freeze().derive(AsyncEventDispatcher)
+        self.assertEqual(await derived.dispatch(self, EVENT_NAME), "hello")
+
+    async def test_caching_middleware(self):
+        calls = []
+
+        async def my_callback_impl(region):
+            calls.append(region)
+            await asyncio.sleep(0)
+            return region.upper()
+
+        manager = SimpleMiddlewareManager(AsyncEventDispatcher())
+        manager.events.implement("provider.regions.get", 2000,
+                                 my_callback_impl)
+        cache = manager.add(CachingMiddleware(["*.get"], 1000))
+        for _ in range(2):
+            self.assertEqual(await manager.events.dispatch(
+                self, "provider.regions.get", "r1"), "R1")
+        self.assertEqual(calls, ["r1"])
+        self.assertEqual(cache.cache_info().hits, 1)
+
+    async def test_single_flight_middleware(self):
+        calls = []
+        release = asyncio.Event()
+
+        async def my_callback_impl(region):
+            calls.append(region)
+            await release.wait()
+            return region.upper()
+
+        manager = SimpleMiddlewareManager(AsyncEventDispatcher())
+        manager.events.implement("provider.regions.get", 2000,
+                                 my_callback_impl)
+        flights = manager.add(SingleFlightMiddleware(["*.get"], 1000))
+        pending = asyncio.gather(*[
+            manager.events.dispatch(self, "provider.regions.get", region)
+            for region in ["r1", "r1", "r2", "r1"]])
+        await asyncio.sleep(0)
+        release.set()
+        self.assertEqual(await pending, ["R1", "R1", "R2", "R1"])
+        self.assertEqual(calls, ["r1", "r2"])
+        self.assertEqual(flights.coalesced, 2)
+
+    async def test_profiler(self):
+        profiler = DispatchProfiler()
+        dispatcher = AsyncEventDispatcher(instrumentation=profiler)
+
+        async def my_callback_obs(event_args, *args, **kwargs):
+            await asyncio.sleep(0)
+
+        async def my_callback_impl(name):
+            return await dispatcher.dispatch(self, "inner.event", name)
+
+        dispatcher.observe("outer.event", 1000, my_callback_obs,
+                           concurrent=True)
+        dispatcher.implement("outer.event", 1001, my_callback_impl)
+        dispatcher.implement("inner.event", 1000, lambda name: name)
+        self.assertEqual(await asyncio.gather(
+            dispatcher.dispatch(self, "outer.event", "a"),
+            dispatcher.dispatch(self, "outer.event", "b")), ["a", "b"])
+
+        # Concurrent dispatches have separate span trees
+        spans = profiler.spans()
+        self.assertEqual(len(spans), 2)
+        for root in spans:
+            self.assertEqual(root.name, "outer.event")
+            self.assertEqual(len(root.children), 2)
+            self.assertEqual(root.children[1].children[0].name,
+                             "inner.event")
+
+    async def test_filtered_handlers(self):
+        callback_tracker = []
+
+        async def my_callback_obs(event_args, *args, **kwargs):
+            callback_tracker.append(kwargs['zone'])
+
+        dispatcher = AsyncEventDispatcher()
+        for priority in (1000, 1001):
+            dispatcher.observe("event.hello", priority, my_callback_obs,
+                               concurrent=True, match={'zone': 'a'})
+        dispatcher.observe("event.hello", 1002, my_callback_obs,
+                           match={'zone': 'b'})
+        dispatcher.implement("event.hello", 1003, lambda zone: zone,
+                             sender_type=AsyncEventDispatcher)
+        self.assertEqual(await dispatcher.dispatch(
+            dispatcher, "event.hello", zone='a'), 'a')
+        self.assertIsNone(await dispatcher.dispatch(
+            self, "event.hello", zone='b'))
+        self.assertEqual(callback_tracker, ['a', 'a', 'b'])
@@ -1,8 +1,13 @@
+import io
+import sys
+import threading
 import unittest
 
+from pyeventsystem.events import ObservingEventHandler
 from pyeventsystem.events import SimpleEventDispatcher
 from pyeventsystem.interfaces import EventHandler
 from pyeventsystem.interfaces import HandlerException
+from pyeventsystem.interfaces import UnhandledEventException
 
 
 class EventSystemTestCase(unittest.TestCase):
@@ -471,3 +476,687 @@ class EventSystemTestCase(unittest.TestCase):
         hndlr2.unsubscribe()
         result = dispatcher.dispatch(self, "event.hello.world")
         self.assertEqual(result, None)
+
+    def test_subscribe_wildcard_matches_whole_event(self):
+        callback_tracker = ['']
+
+        def my_callback(event_args, *args, **kwargs):
+            callback_tracker[0] += event_args.get('event') + "_"
+
+        dispatcher = SimpleEventDispatcher()
+        dispatcher.observe("hello.*", 1000, my_callback)
+        dispatcher.observe("*.world", 1001, my_callback)
+        dispatcher.dispatch(self, "event.hello.there")
+        dispatcher.dispatch(self, "hello.there")
+        dispatcher.dispatch(self, "event.hello.world")
+        self.assertEqual(
+            callback_tracker[0], "hello.there_event.hello.world_",
+            "Patterns should match the whole event name but received"
+            " {0}".format(callback_tracker[0]))
+
+    def test_handler_chain_links(self):
+        EVENT_NAME = "event.hello.world"
+        callback_tracker = ['']
+
+        def my_callback_intcpt(event_args, *args, **kwargs):
+            callback_tracker[0] += "intcpt_"
+            next_handler = event_args.get('next_handler')
+            # unsubscribing during dispatch should not affect the chain
+            # that is currently being executed
+            hndlr1.unsubscribe()
+            return next_handler.invoke(event_args, *args, **kwargs)
+
+        def my_callback_obs(event_args, *args, **kwargs):
+            callback_tracker[0] += "obs_"
+
+        def my_callback_impl(*args, **kwargs):
+            callback_tracker[0] += "impl_"
+            return "world"
+
+        dispatcher = SimpleEventDispatcher()
+        hndlr1 = dispatcher.intercept(EVENT_NAME, 1000, my_callback_intcpt)
+        hndlr2 = dispatcher.observe(EVENT_NAME, 1001, my_callback_obs)
+        hndlr3 = dispatcher.implement(EVENT_NAME, 1002, my_callback_impl)
+
+        chain = dispatcher.get_chain_for_event(EVENT_NAME)
+        self.assertEqual(len(chain), 3)
+        self.assertIs(chain.head.handler, hndlr1)
+        self.assertIs(chain.head.next.handler, hndlr2)
+        self.assertIs(chain.link_for(hndlr2).next, chain.link_for(hndlr3))
+        self.assertIsNone(chain.link_for(hndlr3).next)
+
+        result = dispatcher.dispatch(self, EVENT_NAME)
+        self.assertEqual(callback_tracker[0], "intcpt_obs_impl_")
+        self.assertEqual(result, "world")
+        self.assertIsNot(chain, dispatcher.get_chain_for_event(EVENT_NAME),
+                         "A new chain should be created after unsubscribe")
+
+        # handlers invoked directly should locate their successor through
+        # the dispatcher
+        callback_tracker[0] = ''
+        result = hndlr2.invoke({'event': EVENT_NAME, 'sender': self})
+        self.assertEqual(callback_tracker[0], "obs_impl_")
+        self.assertEqual(result, "world")
+
+    def test_bounded_handler_cache(self):
+        callback_tracker = ['']
+
+        def my_callback(event_args, *args, **kwargs):
+            callback_tracker[0] += "obs_"
+
+        dispatcher = SimpleEventDispatcher(cache_size=2)
+        dispatcher.observe("event.*", 1000, my_callback)
+        dispatcher.dispatch(self, "event.1")
+        dispatcher.dispatch(self, "event.2")
+        dispatcher.dispatch(self, "event.1")
+        # event.2 is the least recently used and should be evicted
+        dispatcher.dispatch(self, "event.3")
+        info = dispatcher.cache_info()
+        self.assertEqual((info.hits, info.misses, info.evictions), (1, 3, 1))
+        self.assertEqual((info.maxsize, info.currsize), (2, 2))
+        dispatcher.dispatch(self, "event.1")
+        dispatcher.dispatch(self, "event.2")
+        info = dispatcher.cache_info()
+        self.assertEqual((info.hits, info.misses, info.evictions), (2, 4, 2))
+        self.assertEqual(callback_tracker[0], "obs_" * 6)
+
+        dispatcher.cache_clear()
+        self.assertEqual(tuple(dispatcher.cache_info()), (0, 0, 0, 2, 0))
+
+        with self.assertRaises(ValueError):
+            SimpleEventDispatcher(cache_size=0)
+
+    def test_subscribe_invalidates_affected_chains_only(self):
+
+        def my_callback(event_args, *args, **kwargs):
+            pass
+
+        dispatcher = SimpleEventDispatcher()
+        dispatcher.observe("event.hello.*", 1000, my_callback)
+        dispatcher.observe("event.other.world", 1001, my_callback)
+        hello_chain = dispatcher.get_chain_for_event("event.hello.world")
+        other_chain = dispatcher.get_chain_for_event("event.other.world")
+        unhandled_chain = dispatcher.get_chain_for_event("event.hello")
+
+        # existing pattern, only chains it contributed to are invalidated
+        dispatcher.observe("event.hello.*", 1002, my_callback)
+        self.assertIsNot(
+            hello_chain, dispatcher.get_chain_for_event("event.hello.world"))
+        self.assertIs(
+            other_chain, dispatcher.get_chain_for_event("event.other.world"))
+        self.assertIs(
+            unhandled_chain, dispatcher.get_chain_for_event("event.hello"))
+
+        # new patterns invalidate the cached events they match
+        hello_chain = dispatcher.get_chain_for_event("event.hello.world")
+        dispatcher.observe("event.hello", 1003, my_callback)
+        self.assertIs(
+            hello_chain, dispatcher.get_chain_for_event("event.hello.world"))
+        self.assertEqual(
+            len(dispatcher.get_chain_for_event("event.hello")), 1)
+        handler = dispatcher.observe("*.world", 1004, my_callback)
+        self.assertEqual(
+            len(dispatcher.get_chain_for_event("event.hello.world")), 3)
+        self.assertEqual(
+            len(dispatcher.get_chain_for_event("event.other.world")), 2)
+        self.assertEqual(
+            len(dispatcher.get_chain_for_event("event.hello")), 1)
+
+        handler.unsubscribe()
+        self.assertEqual(
+            len(dispatcher.get_chain_for_event("event.hello.world")), 2)
+        self.assertEqual(
+            len(dispatcher.get_chain_for_event("event.other.world")), 1)
+
+    def test_subscribe_many(self):
+        EVENT_NAME = "event.hello.world"
+        callback_tracker = ['']
+
+        def my_callback1(event_args, *args, **kwargs):
+            callback_tracker[0] += "event1_"
+
+        def my_callback2(event_args, *args, **kwargs):
+            callback_tracker[0] += "event2_"
+
+        dispatcher = SimpleEventDispatcher()
+        dispatcher.dispatch(self, EVENT_NAME)
+        handlers = [ObservingEventHandler("event.*", 1001, my_callback2),
+                    ObservingEventHandler(EVENT_NAME, 1000, my_callback1)]
+        dispatcher.subscribe_many(handlers)
+        for handler in handlers:
+            self.assertEqual(handler.dispatcher, dispatcher)
+        dispatcher.dispatch(self, EVENT_NAME)
+        self.assertEqual(callback_tracker[0], "event1_event2_")
+
+        dispatcher.unsubscribe_many(handlers)
+        for handler in handlers:
+            self.assertIsNone(handler.dispatcher)
+        self.assertListEqual(
+            [], dispatcher.get_handlers_for_event(EVENT_NAME))
+
+    def test_concurrent_subscribe_and_dispatch(self):
+        EVENT_NAME = "event.hello.world"
+        errors = []
+        done = threading.Event()
+
+        def my_callback_impl(*args, **kwargs):
+            return "world"
+
+        def my_callback_obs(event_args, *args, **kwargs):
+            pass
+
+        dispatcher = SimpleEventDispatcher(cache_size=4)
+        dispatcher.implement(EVENT_NAME, 1000, my_callback_impl)
+
+        def dispatch_events():
+            try:
+                while not done.is_set():
+                    for event in (EVENT_NAME, "event.hello.other"):
+                        result = dispatcher.dispatch(self, event)
+                        if event == EVENT_NAME and result != "world":
+                            errors.append(result)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=dispatch_events)
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        try:
+            for i in range(200):
+                handlers = [
+                    dispatcher.observe("event.*", 2000 + i, my_callback_obs),
+                    dispatcher.observe(EVENT_NAME, 3000 + i, my_callback_obs)]
+                dispatcher.unsubscribe_many(handlers)
+        finally:
+            done.set()
+            for thread in threads:
+                thread.join()
+        self.assertListEqual(errors, [])
+        self.assertListEqual(
+            [my_callback_impl],
+            [h.callback for h in dispatcher.get_handlers_for_event(
+                EVENT_NAME)])
+        self.assertListEqual(
+            [], dispatcher.get_handlers_for_event("event.hello.other"))
+
+    def test_long_handler_chain(self):
+        EVENT_NAME = "event.hello.world"
+        callback_tracker = [0]
+
+        def my_callback_obs(event_args, *args, **kwargs):
+            callback_tracker[0] += 1
+
+        def my_callback_impl(*args, **kwargs):
+            return "world"
+
+        def my_callback_post(event_args, *args, **kwargs):
+            self.assertEqual(event_args['result'], "world")
+            callback_tracker[0] += 1
+
+        # Chains of observers and implementers should not be limited by
+        # the maximum recursion depth
+        chain_length = sys.getrecursionlimit() * 2
+        dispatcher = SimpleEventDispatcher()
+        dispatcher.subscribe_many(
+            [ObservingEventHandler(EVENT_NAME, i, my_callback_obs)
+             for i in range(chain_length)])
+        dispatcher.implement(EVENT_NAME, chain_length, my_callback_impl)
+        dispatcher.subscribe_many(
+            [ObservingEventHandler(EVENT_NAME, chain_length + 1 + i,
+                                   my_callback_post)
+             for i in range(chain_length)])
+        result = dispatcher.dispatch(self, EVENT_NAME)
+        self.assertEqual(result, "world")
+        self.assertEqual(callback_tracker[0], chain_length * 2)
+
+    def test_compact_handlers(self):
+
+        def my_callback(event_args, *args, **kwargs):
+            pass
+
+        dispatcher = SimpleEventDispatcher()
+        handlers = [dispatcher.observe("event.hello.world", 1000, my_callback),
+                    dispatcher.intercept("event.hello.world", 1001,
+                                         my_callback),
+                    dispatcher.implement("event.hello.world", 1002,
+                                         my_callback)]
+        chain = dispatcher.get_chain_for_event("event.hello.world")
+        for handler in handlers:
+            self.assertFalse(hasattr(handler, '__dict__'))
+            self.assertFalse(hasattr(chain.link_for(handler), '__dict__'))
+            self.assertIs(chain.link_for(handler).callback, my_callback)
+        # callbacks may still be replaced
+        handlers[0].callback = len
+        self.assertIs(handlers[0].callback, len)
+
+    def test_dispatch_many(self):
+        EVENT_NAME = "event.hello.world"
+        calls = []
+        batches = []
+
+        def my_callback_impl(*args, **kwargs):
+            calls.append((args, kwargs))
+            return sum(args)
+
+        def my_callback_batch(event_args, batch):
+            batches.append((event_args.get('results'), batch))
+
+        dispatcher = SimpleEventDispatcher()
+        dispatcher.implement(EVENT_NAME, 1000, my_callback_impl)
+        dispatcher.observe_batch(EVENT_NAME, 1001, my_callback_batch)
+
+        results = dispatcher.dispatch_many(self, EVENT_NAME,
+                                           [(1, 2), 3, (4,)], key='value')
+        self.assertEqual(results, [3, 3, 4])
+        self.assertEqual(calls, [((1, 2), {'key': 'value'}),
+                                 ((3,), {'key': 'value'}),
+                                 ((4,), {'key': 'value'})])
+        # The batch observer is notified once, with the whole batch
+        self.assertEqual(batches, [([3, 3, 4],
+                                    [((1, 2), {'key': 'value'}),
+                                     ((3,), {'key': 'value'}),
+                                     ((4,), {'key': 'value'})])])
+
+        # A regular dispatch notifies the batch observer with a single item
+        self.assertEqual(dispatcher.dispatch(self, EVENT_NAME, 5), 5)
+        self.assertEqual(batches[-1][1], [((5,), {})])
+
+    def test_dispatch_many_lazy(self):
+        EVENT_NAME = "event.hello.world"
+        calls = []
+        batches = []
+
+        def my_callback_obs(event_args, *args, **kwargs):
+            calls.append(args)
+
+        def my_callback_batch(event_args, batch):
+            batches.append(batch)
+
+        dispatcher = SimpleEventDispatcher()
+        dispatcher.observe(EVENT_NAME, 1000, my_callback_obs)
+        dispatcher.observe_batch(EVENT_NAME, 1001, my_callback_batch)
+
+        results = dispatcher.dispatch_many_lazy(self, EVENT_NAME, range(3))
+        self.assertEqual(calls, [])
+        self.assertIsNone(next(results))
+        self.assertEqual(calls, [(0,)])
+        self.assertEqual(list(results), [None, None])
+        self.assertEqual(calls, [(0,), (1,), (2,)])
+        self.assertEqual(batches, [[((0,), {}), ((1,), {}), ((2,), {})]])
+
+        # lazy is an ordinary keyword argument of the event
+        dispatcher.implement(EVENT_NAME, 1002, lambda i, lazy: (i, lazy))
+        self.assertEqual(
+            dispatcher.dispatch_many(self, EVENT_NAME, [1], lazy=True),
+            [(1, True)])
+
+    def test_dispatch_many_no_handlers(self):
+        dispatcher = SimpleEventDispatcher()
+        self.assertEqual(
+            dispatcher.dispatch_many(self, "event.hello.world", [1, 2]),
+            [None, None])
+
+        dispatcher = SimpleEventDispatcher(
+            unhandled_policy=SimpleEventDispatcher.RAISE)
+        # The unhandled event is reported before iteration starts
+        with self.assertRaises(UnhandledEventException):
+            dispatcher.dispatch_many_lazy(self, "event.hello.world", [1, 2])
+
+    def test_streaming_implementer(self):
+        EVENT_NAME = "event.hello.world"
+        produced = []
+
+        def my_callback_impl(count):
+            for i in range(count):
+                produced.append(i)
+                yield i
+
+        def my_callback_intcpt(event_args, *args, **kwargs):
+            return event_args['next_handler'].invoke(
+                event_args, *args, **kwargs).map(lambda i: i * 10)
+
+        def my_callback_obs(event_args, *args, **kwargs):
+            # Runs before the interceptor's transform is registered
+            event_args['result'].filter(lambda i: i % 2)
+
+        dispatcher = SimpleEventDispatcher()
+        dispatcher.intercept(EVENT_NAME, 1000, my_callback_intcpt)
+        dispatcher.implement(EVENT_NAME, 1001, my_callback_impl, stream=True)
+        dispatcher.observe(EVENT_NAME, 1002, my_callback_obs)
+
+        result = dispatcher.dispatch(self, EVENT_NAME, 6)
+        # Nothing is produced until the caller iterates over the result
+        self.assertEqual(produced, [])
+        self.assertEqual(next(result), 10)
+        self.assertEqual(produced, [0, 1])
+        self.assertEqual(list(result), [30, 50])
+
+    def test_implementer_list_result_not_streamed(self):
+        dispatcher = SimpleEventDispatcher()
+        dispatcher.implement("event.hello.world", 1000,
+                             lambda count: list(range(count)), stream=True)
+        self.assertEqual(dispatcher.dispatch(self, "event.hello.world", 3),
+                         [0, 1, 2])
+
+    def test_implementer_iterator_result_not_streamed_by_default(self):
+        def my_callback_gen():
+            received = yield "first"
+            yield received
+
+        for compile_threshold in (None, 1):
+            dispatcher = SimpleEventDispatcher(
+                compile_threshold=compile_threshold)
+            dispatcher.implement("event.read", 1000,
+                                 lambda: io.BytesIO(b"hello"))
+            dispatcher.implement("event.generate", 1000, my_callback_gen)
+            for _ in range(2):
+                # Iterators with their own interface are returned as is
+                with dispatcher.dispatch(self, "event.read") as result:
+                    self.assertEqual(result.read(), b"hello")
+                result = dispatcher.dispatch(self, "event.generate")
+                self.assertEqual(next(result), "first")
+                self.assertEqual(result.send("second"), "second")
+
+    def test_unhandled_event_cache(self):
+        def my_callback(event_args, *args, **kwargs):
+            pass
+
+        dispatcher = SimpleEventDispatcher(cache_size=2,
+                                           unhandled_cache_size=2,
+                                           unhandled_policy="ignore")
+        dispatcher.observe("event.*", 1000, my_callback)
+        handled_chain = dispatcher.get_chain_for_event("event.hello")
+        for i in range(10):
+            dispatcher.dispatch(self, "other.{0}".format(i))
+        # Unhandled events don't evict the chains of handled events
+        self.assertIs(handled_chain,
+                      dispatcher.get_chain_for_event("event.hello"))
+        self.assertEqual(dispatcher.unhandled_count, 10)
+        dispatcher.dispatch(self, "other.9")
+        info = dispatcher.unhandled_cache_info()
+        self.assertEqual((info.hits, info.evictions, info.currsize),
+                         (1, 8, 2))
+
+        # Subscribing to a matching pattern invalidates unhandled events
+        dispatcher.observe("other.9", 1001, my_callback)
+        self.assertEqual(len(dispatcher.get_chain_for_event("other.9")), 1)
+        dispatcher.observe("other.*", 1002, my_callback)
+        self.assertEqual(len(dispatcher.get_chain_for_event("other.8")), 1)
+        self.assertEqual(dispatcher.unhandled_cache_info().currsize, 0)
+
+    def test_unhandled_event_policy(self):
+        EVENT_NAME = "event.hello.world"
+        logger = 'pyeventsystem.events'
+
+        dispatcher = SimpleEventDispatcher(unhandled_policy="warn_once")
+        with self.assertLogs(logger, level='WARNING') as logs:
+            for _ in range(3):
+                dispatcher.dispatch(self, EVENT_NAME)
+            dispatcher.dispatch(self, "event.other")
+        self.assertEqual(len(logs.output), 2)
+
+        dispatcher = SimpleEventDispatcher(unhandled_policy="rate_limit",
+                                           unhandled_warning_interval=3600)
+        with self.assertLogs(logger, level='WARNING') as logs:
+            for _ in range(3):
+                dispatcher.dispatch(self, EVENT_NAME)
+        self.assertEqual(len(logs.output), 1)
+        dispatcher.unhandled_warning_interval = 0
+        with self.assertLogs(logger, level='WARNING') as logs:
+            dispatcher.dispatch(self, EVENT_NAME)
+        self.assertIn("2 similar warnings were suppressed", logs.output[0])
+        self.assertEqual(dispatcher.unhandled_count, 4)
+
+        dispatcher = SimpleEventDispatcher(unhandled_policy="raise")
+        with self.assertRaises(UnhandledEventException):
+            dispatcher.dispatch(self, EVENT_NAME)
+
+        with self.assertRaises(ValueError):
+            SimpleEventDispatcher(unhandled_policy="unknown")
+
+    def test_frozen_dispatcher_template(self):
+        EVENT_NAME = "event.hello.world"
+        callback_tracker = ['']
+
+        def my_callback_obs(event_args, *args, **kwargs):
+            callback_tracker[0] += "obs_"
+
+        def my_callback_impl(*args, **kwargs):
+            callback_tracker[0] += "impl_"
+            return "hello"
+
+        dispatcher = SimpleEventDispatcher()
+        obs_handler = dispatcher.observe(EVENT_NAME, 1000, my_callback_obs)
+        dispatcher.implement(EVENT_NAME, 1001, my_callback_impl)
+        dispatcher.observe("event.*", 900, my_callback_obs)
+        template = dispatcher.freeze()
+        # Later changes to the dispatcher don't affect the template
+        obs_handler.unsubscribe()
+        self.assertEqual(len(template.get_chain_for_event(EVENT_NAME)), 3)
+        with self.assertRaises(HandlerException):
+            template.observe(EVENT_NAME, 1002, my_callback_obs)
+
+        derived1 = template.derive()
+        derived2 = template.derive()
+        # Derived dispatchers share the chains of the template
+        chain = template.get_chain_for_event(EVENT_NAME)
+        self.assertIs(chain, derived1.get_chain_for_event(EVENT_NAME))
+        self.assertIs(chain, derived2.get_chain_for_event(EVENT_NAME))
+        self.assertEqual(derived1.dispatch(self, EVENT_NAME), "hello")
+        self.assertEqual(callback_tracker[0], "obs_obs_impl_")
+
+        # Their own subscriptions only affect the events they match
+        other_chain = template.get_chain_for_event("event.other")
+        derived1.observe(EVENT_NAME, 1002, my_callback_obs)
+        self.assertEqual(len(derived1.get_chain_for_event(EVENT_NAME)), 4)
+        self.assertIs(other_chain,
+                      derived1.get_chain_for_event("event.other"))
+        self.assertIs(chain, derived2.get_chain_for_event(EVENT_NAME))
+        derived2.unsubscribe(obs_handler)
+        self.assertEqual(len(derived2.get_chain_for_event(EVENT_NAME)), 2)
+        self.assertEqual(len(template.get_chain_for_event(EVENT_NAME)), 3)
+        self.assertIs(other_chain,
+                      derived2.get_chain_for_event("event.other"))
+        callback_tracker[0] = ''
+        self.assertEqual(derived2.dispatch(self, EVENT_NAME), "hello")
+        self.assertEqual(callback_tracker[0], "obs_impl_")
+        # Including handlers with wildcard patterns
+        derived2.observe("*.other", 1000, my_callback_obs)
+        self.assertEqual(len(derived2.get_chain_for_event("event.other")), 2)
+        self.assertIs(other_chain,
+                      derived1.get_chain_for_event("event.other"))
+
+    def test_compiled_chain(self):
+        EVENT_NAME = "event.hello.world"
+
+        def build(dispatcher, tracker):
+            def my_callback_obs(event_args, *args, **kwargs):
+                tracker.append(("obs", args, kwargs,
+                                'next_handler' in event_args,
+                                event_args.get('result')))
+
+            def my_callback_intcpt(event_args, *args, **kwargs):
+                tracker.append(("intcpt", args, kwargs))
+                result = event_args['next_handler'].invoke(
+                    event_args, *args, **kwargs)
+                return "intcpt_" + str(result)
+
+            def my_callback_impl(*args, **kwargs):
+                tracker.append(("impl", args, kwargs))
+                return "impl"
+
+            dispatcher.observe(EVENT_NAME, 1000, my_callback_obs)
+            dispatcher.intercept(EVENT_NAME, 1001, my_callback_intcpt)
+            dispatcher.observe(EVENT_NAME, 1002, my_callback_obs)
+            dispatcher.implement(EVENT_NAME, 1003, my_callback_impl)
+            dispatcher.observe(EVENT_NAME, 1004, my_callback_obs)
+            dispatcher.implement(EVENT_NAME, 1005, my_callback_impl)
+            dispatcher.intercept(EVENT_NAME, 1006, my_callback_intcpt)
+            dispatcher.observe(EVENT_NAME, 1007, my_callback_obs)
+
+        expected = []
+        dispatcher = SimpleEventDispatcher()
+        build(dispatcher, expected)
+        expected_result = dispatcher.dispatch(self, EVENT_NAME, 1, key=2)
+
+        tracker = []
+        dispatcher = SimpleEventDispatcher(compile_threshold=2)
+        build(dispatcher, tracker)
+        chain = dispatcher.get_chain_for_event(EVENT_NAME)
+        for compiled in (False, True, True):
+            del tracker[:]
+            self.assertEqual(expected_result,
+                             dispatcher.dispatch(self, EVENT_NAME, 1, key=2))
+            self.assertEqual(expected, tracker)
+            self.assertEqual(compiled, chain.compiled)
+
+        # Subscription changes replace the compiled chain
+        dispatcher.observe(EVENT_NAME, 999, lambda event_args: None)
+        chain = dispatcher.get_chain_for_event(EVENT_NAME)
+        self.assertFalse(chain.compiled)
+        self.assertEqual(len(chain), 9)
+
+    def test_priority_ordered_subscriptions(self):
+
+        def my_callback(event_args, *args, **kwargs):
+            pass
+
+        dispatcher = SimpleEventDispatcher()
+        handlers = [ObservingEventHandler(pattern, priority, my_callback)
+                    for pattern, priority in [
+                        ("event.hello.world", 1005), ("event.*", 1001),
+                        ("event.hello.world", 1000), ("*.world", 1003),
+                        ("event.*", 1004), ("event.hello.world", 1002)]]
+        dispatcher.subscribe_many(handlers[:3])
+        for handler in handlers[3:]:
+            dispatcher.subscribe(handler)
+        self.assertEqual(
+            [1000, 1001, 1002, 1003, 1004, 1005],
+            [h.priority for h
+             in dispatcher.get_handlers_for_event("event.hello.world")])
+
+        dispatcher.unsubscribe_many([handlers[5], handlers[0]])
+        dispatcher.unsubscribe(handlers[1])
+        self.assertEqual(
+            [1000, 1003, 1004],
+            [h.priority for h
+             in dispatcher.get_handlers_for_event("event.hello.world")])
+        with self.assertRaises(ValueError):
+            dispatcher.unsubscribe(handlers[0])
+
+        # Handlers added together are merged with the existing ones, in
+        # priority order
+        dispatcher.subscribe_many([
+            ObservingEventHandler("event.hello.world", priority, my_callback)
+            for priority in (1006, 999, 1002)])
+        self.assertEqual(
+            [999, 1000, 1002, 1003, 1004, 1006],
+            [h.priority for h
+             in dispatcher.get_handlers_for_event("event.hello.world")])
+
+        # Duplicate priorities are detected while merging the patterns
+        dispatcher.observe("*.world", 1000, my_callback)
+        with self.assertRaises(HandlerException):
+            dispatcher.get_handlers_for_event("event.hello.world")
+        self.assertEqual(
+            2, len(dispatcher.get_handlers_for_event("other.world")))
+
+    def test_filtered_handlers(self):
+        EVENT_NAME = "event.hello.world"
+
+        class Sender(object):
+            pass
+
+        for compile_threshold in (None, 1):
+            callback_tracker = []
+            dispatcher = SimpleEventDispatcher(
+                compile_threshold=compile_threshold)
+
+            def my_callback_intcpt(event_args, *args, **kwargs):
+                return "intercepted:" + event_args['next_handler'].invoke(
+                    event_args, *args, **kwargs)
+
+            dispatcher.observe(
+                EVENT_NAME, 1000,
+                lambda event_args, **kwargs: callback_tracker.append("obs"),
+                match={'zone': 'a'})
+            dispatcher.intercept(EVENT_NAME, 1001, my_callback_intcpt,
+                                 match={'zone': 'b'})
+            dispatcher.implement(EVENT_NAME, 1002, lambda **kwargs: "impl-a",
+                                 match={'zone': 'a'})
+            dispatcher.implement(EVENT_NAME, 1003,
+                                 lambda **kwargs: "impl-default")
+            dispatcher.observe(
+                EVENT_NAME, 1004,
+                lambda event_args, **kwargs: callback_tracker.append(
+                    "sender"),
+                sender_type=Sender)
+
+            for _ in range(2):
+                callback_tracker[:] = []
+                self.assertEqual(
+                    dispatcher.dispatch(Sender(), EVENT_NAME, zone='a'),
+                    "impl-a")
+                self.assertEqual(callback_tracker, ["obs", "sender"])
+                callback_tracker[:] = []
+                self.assertEqual(
+                    dispatcher.dispatch(self, EVENT_NAME, zone='b'),
+                    "intercepted:impl-default")
+                self.assertEqual(
+                    dispatcher.dispatch(self, EVENT_NAME, zone=None),
+                    "impl-default")
+                self.assertEqual(dispatcher.dispatch(self, EVENT_NAME),
+                                 "impl-default")
+                self.assertEqual(callback_tracker, [])
+
+            chain = dispatcher.get_chain_for_event(EVENT_NAME)
+            self.assertTrue(chain.sender_filtered)
+            # Handlers filtered on the sender type are excluded from the
+            # chain of other senders
+            self.assertEqual(len(chain.for_sender_type(Sender)), 5)
+            self.assertEqual(len(chain.for_sender_type(type(self))), 4)
+            self.assertEqual(chain.for_sender_type(Sender).compiled,
+                             compile_threshold is not None)
+
+        # Events whose handlers all filter out the sender are not unhandled
+        dispatcher = SimpleEventDispatcher(
+            unhandled_policy=SimpleEventDispatcher.RAISE)
+        dispatcher.implement(EVENT_NAME, 1000, lambda: "hello",
+                             sender_type=Sender)
+        self.assertIsNone(dispatcher.dispatch(self, EVENT_NAME))
+        self.assertEqual(dispatcher.dispatch(Sender(), EVENT_NAME), "hello")
+
+    def test_filtered_implementer_event_args(self):
+        EVENT_NAME = "event.hello.world"
+
+        for compile_threshold in (None, 1):
+            dispatcher = SimpleEventDispatcher(
+                compile_threshold=compile_threshold)
+            invocations = []
+
+            def my_callback_retry(event_args, *args, **kwargs):
+                # Invokes the remainder of the chain twice, which requires
+                # the next_handler to still be present afterwards
+                for _ in range(2):
+                    result = event_args['next_handler'].invoke(
+                        event_args, *args, **kwargs)
+                    invocations.append(sorted(event_args))
+                return result
+
+            dispatcher.intercept(EVENT_NAME, 1000, my_callback_retry)
+            dispatcher.implement(EVENT_NAME, 1001, lambda **kwargs: "b",
+                                 match={'zone': 'b'})
+            dispatcher.implement(EVENT_NAME, 1002, lambda **kwargs: "any")
+
+            for _ in range(2):
+                invocations[:] = []
+                self.assertEqual(dispatcher.dispatch(self, EVENT_NAME,
+                                                     zone='a'), "any")
+                # Only implementers which ran clean up event_args once the
+                # remainder of the chain has run
+                self.assertEqual(invocations,
+                                 [['event', 'next_handler', 'sender']] * 2)
+            self.assertEqual(
+                dispatcher.get_chain_for_event(EVENT_NAME).compiled,
+                compile_threshold is not None)
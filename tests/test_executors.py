@@ -0,0 +1,114 @@
+import threading
+import unittest
+
+from pyeventsystem.events import SimpleEventDispatcher
+from pyeventsystem.executors import ObserverExecutor
+
+
+class ObserverExecutorTestCase(unittest.TestCase):
+
+    EVENT_NAME = "event.hello.world"
+
+    def test_background_observer(self):
+        release = threading.Event()
+        callback_tracker = []
+
+        def my_callback_obs(event_args, *args, **kwargs):
+            release.wait(5)
+            self.assertDictEqual(event_args, {'sender': self,
+                                              'event': self.EVENT_NAME})
+            self.assertSequenceEqual(args, ['first_pos_arg'])
+            callback_tracker.append("obs")
+
+        def my_callback_impl(*args, **kwargs):
+            callback_tracker.append("impl")
+            return "world"
+
+        executor = ObserverExecutor(max_workers=1)
+        dispatcher = SimpleEventDispatcher()
+        dispatcher.observe(self.EVENT_NAME, 1000, my_callback_obs,
+                           executor=executor)
+        dispatcher.implement(self.EVENT_NAME, 1001, my_callback_impl)
+        result = dispatcher.dispatch(self, self.EVENT_NAME, 'first_pos_arg')
+        # The chain should continue while the observer is still pending
+        self.assertEqual(result, "world")
+        self.assertListEqual(callback_tracker, ["impl"])
+        self.assertEqual(executor.pending, 1)
+
+        release.set()
+        self.assertTrue(executor.flush(timeout=5))
+        self.assertListEqual(callback_tracker, ["impl", "obs"])
+        self.assertEqual(executor.pending, 0)
+        executor.shutdown()
+
+    def _saturate(self, overflow):
+        release = threading.Event()
+        callback_tracker = []
+
+        def my_callback_obs(event_args, *args, **kwargs):
+            if threading.current_thread() is not main_thread:
+                release.wait(5)
+            callback_tracker.append(event_args['sender'])
+
+        main_thread = threading.current_thread()
+        executor = ObserverExecutor(max_workers=1, max_pending=1,
+                                    overflow=overflow)
+        dispatcher = SimpleEventDispatcher(observer_executor=executor)
+        dispatcher.observe(self.EVENT_NAME, 1000, my_callback_obs)
+        dispatcher.dispatch("first", self.EVENT_NAME)
+        dispatcher.dispatch("second", self.EVENT_NAME)
+        release.set()
+        self.assertTrue(executor.flush(timeout=5))
+        executor.shutdown()
+        return executor, callback_tracker
+
+    def test_overflow_drop(self):
+        executor, callback_tracker = self._saturate(ObserverExecutor.DROP)
+        self.assertListEqual(callback_tracker, ["first"])
+        self.assertEqual(executor.dropped, 1)
+
+    def test_overflow_inline(self):
+        executor, callback_tracker = self._saturate(ObserverExecutor.INLINE)
+        self.assertListEqual(callback_tracker, ["second", "first"])
+        self.assertEqual(executor.dropped, 0)
+
+    def test_submit_after_shutdown(self):
+        callback_tracker = []
+
+        def my_callback_obs(event_args, *args, **kwargs):
+            callback_tracker.append(threading.current_thread())
+
+        for overflow in (ObserverExecutor.BLOCK, ObserverExecutor.DROP):
+            executor = ObserverExecutor(overflow=overflow)
+            dispatcher = SimpleEventDispatcher(observer_executor=executor)
+            dispatcher.observe(self.EVENT_NAME, 1000, my_callback_obs)
+            dispatcher.implement(self.EVENT_NAME, 1001, lambda: "world")
+            executor.shutdown()
+            # The dispatch should not fail, and the observer is dropped
+            self.assertEqual(dispatcher.dispatch(self, self.EVENT_NAME),
+                             "world")
+            self.assertEqual(executor.dropped, 1)
+            self.assertListEqual(callback_tracker, [])
+
+        executor = ObserverExecutor(overflow=ObserverExecutor.INLINE)
+        dispatcher = SimpleEventDispatcher(observer_executor=executor)
+        dispatcher.observe(self.EVENT_NAME, 1000, my_callback_obs)
+        executor.shutdown()
+        dispatcher.dispatch(self, self.EVENT_NAME)
+        self.assertListEqual(callback_tracker, [threading.current_thread()])
+        self.assertEqual(executor.dropped, 0)
+
+    def test_observer_exception_is_logged(self):
+
+        def my_callback_obs(event_args, *args, **kwargs):
+            raise ValueError("observer failure")
+
+        executor = ObserverExecutor()
+        dispatcher = SimpleEventDispatcher(observer_executor=executor)
+        dispatcher.observe(self.EVENT_NAME, 1000, my_callback_obs)
+        with self.assertLogs('pyeventsystem.executors', level='ERROR'):
+            dispatcher.dispatch(self, self.EVENT_NAME)
+            executor.shutdown(wait=True)
+
+        with self.assertRaises(ValueError):
+            ObserverExecutor(overflow="unknown")
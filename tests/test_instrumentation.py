@@ -0,0 +1,92 @@
+import unittest
+
+from pyeventsystem.events import SimpleEventDispatcher
+from pyeventsystem.instrumentation import HandlerStats
+from pyeventsystem.instrumentation import Instrumentation
+
+
+class InstrumentationTestCase(unittest.TestCase):
+
+    def test_record_handler_calls(self):
+        EVENT_NAME = "event.hello.world"
+
+        def my_callback_obs(event_args, *args, **kwargs):
+            pass
+
+        def my_callback_intcpt(event_args, *args, **kwargs):
+            return event_args['next_handler'].invoke(
+                event_args, *args, **kwargs)
+
+        def my_callback_impl(fail=False):
+            if fail:
+                raise ValueError("failed")
+            return "hello"
+
+        monitor = Instrumentation()
+        dispatcher = SimpleEventDispatcher(instrumentation=monitor)
+        dispatcher.observe(EVENT_NAME, 1000, my_callback_obs)
+        dispatcher.intercept(EVENT_NAME, 1001, my_callback_intcpt)
+        dispatcher.implement(EVENT_NAME, 1002, my_callback_impl)
+
+        for _ in range(3):
+            self.assertEqual(dispatcher.dispatch(self, EVENT_NAME), "hello")
+        with self.assertRaises(ValueError):
+            dispatcher.dispatch(self, EVENT_NAME, fail=True)
+
+        snapshot = monitor.snapshot()
+        self.assertEqual([s.priority for s in snapshot], [1000, 1001, 1002])
+        self.assertEqual([s.calls for s in snapshot], [4, 4, 4])
+        # The interceptor also fails, since it invokes the implementer
+        self.assertEqual([s.errors for s in snapshot], [0, 1, 1])
+        self.assertTrue(snapshot[2].name.endswith("my_callback_impl"))
+        for stats in snapshot:
+            self.assertEqual(stats.event, EVENT_NAME)
+            self.assertGreaterEqual(stats.total_time, 0)
+            self.assertLessEqual(stats.p50, stats.p99)
+            self.assertLessEqual(stats.p99, stats.max_time)
+        self.assertEqual(monitor.snapshot("event.other"), [])
+
+        monitor.reset()
+        self.assertEqual(monitor.snapshot(), [])
+
+    def test_toggle_instrumentation(self):
+        EVENT_NAME = "event.hello.world"
+
+        dispatcher = SimpleEventDispatcher()
+        dispatcher.implement(EVENT_NAME, 1000, lambda: "hello")
+        dispatcher.dispatch(self, EVENT_NAME)
+
+        monitor = Instrumentation()
+        dispatcher.instrumentation = monitor
+        dispatcher.dispatch(self, EVENT_NAME)
+        dispatcher.instrumentation = None
+        dispatcher.dispatch(self, EVENT_NAME)
+        self.assertEqual([s.calls for s in monitor.snapshot()], [1])
+
+    def test_bounded_stats(self):
+        dispatcher = SimpleEventDispatcher(
+            instrumentation=Instrumentation(maxsize=2))
+        dispatcher.observe("event.*", 1000, lambda event_args: None)
+        for i in range(5):
+            dispatcher.dispatch(self, "event.{0}".format(i))
+        dispatcher.dispatch(self, "event.3")
+        self.assertEqual(
+            [(s.event, s.calls)
+             for s in dispatcher.instrumentation.snapshot()],
+            [("event.3", 2), ("event.4", 1)])
+
+        with self.assertRaises(ValueError):
+            Instrumentation(maxsize=0)
+
+    def test_handler_stats_percentile(self):
+        stats = HandlerStats()
+        self.assertEqual(stats.percentile(50), 0.0)
+        for _ in range(99):
+            stats.add(1e-6, False)
+        stats.add(1e-3, True)
+        self.assertEqual(stats.calls, 100)
+        self.assertEqual(stats.errors, 1)
+        self.assertEqual(stats.max_time, 1e-3)
+        # Percentiles are the upper bound of the histogram bucket
+        self.assertTrue(1e-6 <= stats.percentile(50) < 2e-6)
+        self.assertEqual(stats.percentile(100), 1e-3)
@@ -0,0 +1,79 @@
+import multiprocessing
+import os
+import unittest
+
+from pyeventsystem.ipc import EventCollector
+from pyeventsystem.ipc import EventForwarder
+from pyeventsystem.ipc import RemoteSender
+from pyeventsystem.middleware import SimpleMiddlewareManager
+
+
+def _raise_events(queue):
+    manager = SimpleMiddlewareManager()
+    forwarder = manager.add(EventForwarder(queue, ["provider.*"], 2000))
+    for i in range(3):
+        manager.events.dispatch(None, "provider.volumes.create", i, size=i)
+    manager.remove(forwarder)
+
+
+class IPCTestCase(unittest.TestCase):
+
+    def test_forward_events(self):
+        callback_tracker = []
+
+        def my_callback(event_args, *args, **kwargs):
+            callback_tracker.append((event_args['event'], args, kwargs))
+
+        queue = multiprocessing.Queue()
+        manager = SimpleMiddlewareManager()
+        forwarder = manager.add(EventForwarder(
+            queue, ["provider.storage.*", "provider.compute.list"], 2000,
+            batch_size=2))
+        manager.events.dispatch(self, "provider.storage.create", 1, key=2)
+        manager.events.dispatch(self, "provider.networking.create")
+        # Arguments which cannot be pickled are dropped
+        with self.assertLogs('pyeventsystem.ipc', level='ERROR'):
+            manager.events.dispatch(self, "provider.storage.create",
+                                    lambda: 0)
+        manager.events.dispatch(self, "provider.compute.list")
+
+        collector = EventCollector(queue)
+        collector.observe("provider.storage.*", 1000, my_callback)
+        self.assertTrue(collector.receive(timeout=5))
+        self.assertEqual(callback_tracker,
+                         [("provider.storage.create", (1,), {'key': 2})])
+        # The last batch isn't full, so it is sent on flush
+        manager.remove(forwarder)
+        collector.observe("provider.compute.*", 1001, my_callback)
+        senders = []
+        collector.observe("provider.*", 999,
+                          lambda event_args: senders.append(
+                              event_args['sender']))
+        self.assertTrue(collector.receive(timeout=5))
+        self.assertEqual(callback_tracker[1:],
+                         [("provider.compute.list", (), {})])
+        self.assertEqual(senders, [RemoteSender(os.getpid(), id(self))])
+
+        # Timing out without a message is not an error
+        self.assertTrue(collector.receive(timeout=0.01))
+        self.assertEqual(len(callback_tracker), 2)
+
+        collector.stop()
+        self.assertFalse(collector.receive(timeout=5))
+
+    def test_collect_from_other_process(self):
+        callback_tracker = []
+
+        def my_callback(event_args, *args, **kwargs):
+            callback_tracker.append((event_args['sender'].pid, args, kwargs))
+
+        queue = multiprocessing.Queue()
+        collector = EventCollector(queue)
+        collector.observe("provider.volumes.create", 1000, my_callback)
+        collector.start()
+        worker = multiprocessing.Process(target=_raise_events, args=(queue,))
+        worker.start()
+        worker.join()
+        collector.stop()
+        self.assertEqual(callback_tracker,
+                         [(worker.pid, (i,), {'size': i}) for i in range(3)])
@@ -1,10 +1,14 @@
+import threading
+import time
 import unittest
 
 from pyeventsystem.events import SimpleEventDispatcher
 from pyeventsystem.interfaces import HandlerException
 from pyeventsystem.interfaces import Middleware
 from pyeventsystem.middleware import BaseMiddleware
+from pyeventsystem.middleware import CachingMiddleware
 from pyeventsystem.middleware import SimpleMiddlewareManager
+from pyeventsystem.middleware import SingleFlightMiddleware
 from pyeventsystem.middleware import dispatch
 from pyeventsystem.middleware import implement
 from pyeventsystem.middleware import intercept
@@ -464,3 +468,387 @@ class MiddlewareSystemTestCase(unittest.TestCase):
         obj = ChildMiddlewareClass()
         obj.my_callback_impl()
         self.assertEqual(invocation_order[0], "base_child")
+
+    def test_event_decorator_nested_dispatcher_attr(self):
+        EVENT_NAME = "some.event.occurred"
+        invocation_order = [""]
+
+        class Provider(object):
+
+            def __init__(self):
+                self.middleware = SimpleMiddlewareManager()
+
+        class SomeDummyClass(object):
+
+            def __init__(self, provider):
+                self.provider = provider
+
+            @dispatch(event=EVENT_NAME, priority=2500,
+                      dispatcher_attr='provider.middleware.events')
+            def my_callback_impl(self, *args, **kwargs):
+                invocation_order[0] += "impl_"
+                return "hello"
+
+            @observe(event_pattern=EVENT_NAME, priority=2600)
+            def my_callback_obs(self, event_args, *args, **kwargs):
+                invocation_order[0] += "obs_"
+
+        provider = Provider()
+        obj1 = SomeDummyClass(provider)
+        obj2 = SomeDummyClass(provider)
+        provider.middleware.add(obj1)
+        chain = provider.middleware.events.get_chain_for_event(EVENT_NAME)
+        self.assertTrue(chain.has_bound_callback(
+            obj1, SomeDummyClass.my_callback_impl.__wrapped__))
+        self.assertFalse(chain.has_bound_callback(
+            obj2, SomeDummyClass.my_callback_impl.__wrapped__))
+
+        # Only obj1 is registered, so obj2 should not dispatch the event
+        self.assertEqual(obj2.my_callback_impl(), "hello")
+        self.assertEqual(invocation_order[0], "impl_")
+        invocation_order[0] = ""
+        self.assertEqual(obj1.my_callback_impl(), "hello")
+        self.assertEqual(invocation_order[0], "impl_obs_")
+
+        with self.assertRaises(HandlerException):
+            SomeDummyClass(None).my_callback_impl()
+
+    def test_discover_handlers_per_class(self):
+        EVENT_NAME = "some.event.occurred"
+
+        class SomeDummyClass(object):
+
+            @observe(event_pattern=EVENT_NAME, priority=2400)
+            def my_callback_obs(self, event_args, *args, **kwargs):
+                pass
+
+            @implement(event_pattern=EVENT_NAME, priority=2500)
+            def my_callback_impl(self, *args, **kwargs):
+                return self
+
+            @staticmethod
+            @observe(event_pattern=EVENT_NAME, priority=2600)
+            def not_a_method(event_args, *args, **kwargs):
+                pass
+
+            @property
+            def not_a_handler(self):
+                raise AttributeError("should not be evaluated")
+
+        obj1 = SomeDummyClass()
+        obj2 = SomeDummyClass()
+        handlers1 = BaseMiddleware.discover_handlers(obj1)
+        handlers2 = BaseMiddleware.discover_handlers(obj2)
+        self.assertEqual([obj1.my_callback_impl, obj1.my_callback_obs],
+                         [h.callback for h in handlers1])
+        self.assertEqual([obj2.my_callback_impl, obj2.my_callback_obs],
+                         [h.callback for h in handlers2])
+        self.assertIsNot(handlers1[0], handlers2[0])
+
+        # Classes only have their classmethods discovered
+        self.assertEqual([], BaseMiddleware.discover_handlers(SomeDummyClass))
+
+    def test_caching_middleware(self):
+        calls = []
+        now = [0.0]
+
+        def list_regions(*args, **kwargs):
+            calls.append((args, kwargs))
+            return ["region-{0}".format(len(calls))]
+
+        manager = SimpleMiddlewareManager()
+        manager.events.implement("provider.compute.regions.list", 2500,
+                                 list_regions)
+        manager.events.implement("provider.compute.regions.get", 2500,
+                                 list_regions)
+        manager.events.implement("provider.compute.regions.create", 2500,
+                                 lambda *args, **kwargs: None)
+        cache = manager.add(CachingMiddleware(
+            ["*.list", "*.get"], 1000, maxsize=2, ttl=10,
+            invalidated_by={"*.create": ["*.list"]},
+            clock=lambda: now[0]))
+
+        def list_(*args, **kwargs):
+            return manager.events.dispatch(self, "provider.compute.regions."
+                                           "list", *args, **kwargs)
+
+        self.assertEqual(list_(limit=1, filters={'a': [1]}), ["region-1"])
+        self.assertEqual(list_(filters={'a': [1]}, limit=1), ["region-1"])
+        self.assertEqual(list_(limit=2), ["region-2"])
+        # Different senders do not share results
+        self.assertEqual(manager.events.dispatch(
+            None, "provider.compute.regions.list", limit=2), ["region-3"])
+        self.assertEqual(len(calls), 3)
+        info = cache.cache_info()
+        self.assertEqual((info.hits, info.misses, info.evictions,
+                          info.currsize), (1, 3, 1, 2))
+        self.assertEqual(info.hit_rate, 0.25)
+
+        # Results expire after the ttl
+        now[0] = 11
+        self.assertEqual(list_(limit=2), ["region-4"])
+        self.assertEqual(cache.cache_info().expirations, 1)
+
+        # Creating an object invalidates list results, but not get results
+        manager.events.dispatch(self, "provider.compute.regions.get", "r1")
+        manager.events.dispatch(self, "provider.compute.regions.create")
+        self.assertEqual(list_(limit=2), ["region-6"])
+        self.assertEqual(manager.events.dispatch(
+            self, "provider.compute.regions.get", "r1"), ["region-5"])
+        self.assertEqual(cache.cache_info().invalidations, 1)
+
+        # Unhashable arguments bypass the cache
+        self.assertEqual(list_(object_=bytearray(b"x")), ["region-7"])
+        self.assertEqual(list_(object_=bytearray(b"x")), ["region-8"])
+
+        manager.remove(cache)
+        self.assertEqual(list_(limit=2), ["region-9"])
+
+    def test_caching_middleware_keys(self):
+        calls = []
+
+        def list_regions(*args, **kwargs):
+            calls.append((args, kwargs))
+            if kwargs.get('create'):
+                # Invalidates the list while it is being computed
+                manager.events.dispatch(self,
+                                        "provider.compute.regions.create")
+            if kwargs.get('fail'):
+                raise ValueError("failed")
+            return len(calls)
+
+        manager = SimpleMiddlewareManager()
+        manager.events.implement("provider.compute.regions.list", 2500,
+                                 list_regions)
+        manager.events.implement("provider.compute.regions.create", 2500,
+                                 lambda *args, **kwargs: None)
+        cache = manager.add(CachingMiddleware(
+            ["*.list"], 1000, invalidated_by={"*.create": ["*.list"]}))
+
+        def list_(*args, **kwargs):
+            return manager.events.dispatch(self, "provider.compute.regions."
+                                           "list", *args, **kwargs)
+
+        # Equal values of different types do not share results
+        self.assertEqual(list_(1), 1)
+        self.assertEqual(list_(True), 2)
+        self.assertEqual(list_([1]), 3)
+        self.assertEqual(list_((1,)), 4)
+        self.assertEqual(list_({1: "a"}), 5)
+        self.assertEqual(list_({True: "a"}), 6)
+        self.assertEqual((list_(1), list_(True), list_([1]), list_((1,))),
+                         (1, 2, 3, 4))
+
+        # Dicts with keys that cannot be ordered bypass the cache
+        self.assertEqual(list_({1: "a", "b": 2}), 7)
+        self.assertEqual(list_({1: "a", "b": 2}), 8)
+
+        # A result computed across an invalidation is not cached
+        self.assertEqual(list_(create=True), 9)
+        self.assertEqual(list_(create=True), 10)
+        self.assertEqual(cache.cache_info().currsize, 0)
+
+        # Failures are not cached, and do not prevent later results from
+        # being cached
+        with self.assertRaises(ValueError):
+            list_(fail=True)
+        self.assertEqual(list_(), 12)
+        self.assertEqual(list_(), 12)
+
+    def test_caching_middleware_patterns(self):
+        calls = []
+
+        def list_regions(*args, **kwargs):
+            calls.append(args)
+            return len(calls)
+
+        manager = SimpleMiddlewareManager()
+        manager.events.implement("provider.compute.regions.list", 2500,
+                                 list_regions)
+        manager.events.implement("other.regions.get", 2500, list_regions)
+        manager.events.observe("provider.compute.regions.create", 2500,
+                               lambda event_args: None)
+        # Overlapping patterns, and an invalidating pattern which overlaps
+        # the cached patterns
+        cache = manager.add(CachingMiddleware(
+            ["*.list", "provider.*"], 100,
+            invalidated_by={"*": ["*.list"], "*.create": ["provider.*"]}))
+
+        def dispatch(event, *args):
+            return manager.events.dispatch(self, event, *args)
+
+        self.assertEqual(dispatch("provider.compute.regions.list"), 1)
+        self.assertEqual(dispatch("other.regions.get", 1), 2)
+        # Every event invalidates list results, including lists themselves
+        self.assertEqual(dispatch("provider.compute.regions.list"), 3)
+        self.assertEqual(dispatch("other.regions.get", 1), 4)
+        self.assertEqual(dispatch("other.regions.get", 1), 5)
+        self.assertEqual(cache.cache_info().misses, 2)
+        manager.remove(cache)
+
+        # The middleware may be the last handler in the chain, in which case
+        # there is nothing to cache
+        cache = manager.add(CachingMiddleware(
+            ["provider.*"], 3000,
+            invalidated_by={"*.create": ["provider.*"]}))
+        self.assertEqual(dispatch("provider.compute.regions.list"), 6)
+        self.assertEqual(dispatch("provider.compute.regions.list"), 7)
+        self.assertIsNone(dispatch("provider.compute.regions.create"))
+        self.assertEqual(cache.cache_info().misses, 0)
+
+    def test_single_flight_middleware(self):
+        EVENT_NAME = "provider.compute.regions.list"
+        calls = []
+        started = threading.Event()
+        release = threading.Event()
+
+        def my_callback_impl(fail=False):
+            calls.append(fail)
+            started.set()
+            release.wait()
+            if fail:
+                raise ValueError("failed")
+            return ["region-{0}".format(len(calls))]
+
+        manager = SimpleMiddlewareManager()
+        manager.events.implement(EVENT_NAME, 2500, my_callback_impl)
+        flights = manager.add(SingleFlightMiddleware(["*.list"], 1000))
+
+        def burst(count, **kwargs):
+            results = [None] * count
+
+            def worker(i):
+                try:
+                    results[i] = manager.events.dispatch(self, EVENT_NAME,
+                                                         **kwargs)
+                except ValueError as e:
+                    results[i] = e
+
+            started.clear()
+            release.clear()
+            coalesced = flights.coalesced
+            threads = [threading.Thread(target=worker, args=(i,))
+                       for i in range(count)]
+            threads[0].start()
+            self.assertTrue(started.wait(5))
+            for thread in threads[1:]:
+                thread.start()
+            while flights.coalesced < coalesced + count - 1:
+                time.sleep(0.001)
+            release.set()
+            for thread in threads:
+                thread.join()
+            return results
+
+        self.assertEqual(burst(5), [["region-1"]] * 5)
+        self.assertEqual(calls, [False])
+        errors = burst(3, fail=True)
+        self.assertEqual(calls, [False, True])
+        self.assertIsInstance(errors[0], ValueError)
+        self.assertTrue(all(e is errors[0] for e in errors))
+
+        # Later dispatches run the chain again
+        release.set()
+        self.assertEqual(manager.events.dispatch(self, EVENT_NAME),
+                         ["region-3"])
+        self.assertEqual(flights.coalesced, 6)
+
+    def test_filtered_decorators(self):
+        EVENT_NAME = "some.event.occurred"
+        callback_tracker = []
+
+        class Provider(object):
+            pass
+
+        class SomeDummyClass(object):
+
+            @observe(event_pattern=EVENT_NAME, priority=2400,
+                     match={'zone': 'a'})
+            def my_callback_obs(self, event_args, *args, **kwargs):
+                callback_tracker.append("obs")
+
+            @intercept(event_pattern=EVENT_NAME, priority=2450,
+                       sender_type=Provider)
+            def my_callback_intcpt(self, event_args, *args, **kwargs):
+                callback_tracker.append("intcpt")
+                return event_args['next_handler'].invoke(
+                    event_args, *args, **kwargs)
+
+            @implement(event_pattern=EVENT_NAME, priority=2500)
+            def my_callback_impl(self, *args, **kwargs):
+                return "hello"
+
+        manager = SimpleMiddlewareManager()
+        manager.add(SomeDummyClass())
+        self.assertEqual(manager.events.dispatch(Provider(), EVENT_NAME,
+                                                 zone='a'), "hello")
+        self.assertEqual(callback_tracker, ["obs", "intcpt"])
+        callback_tracker[:] = []
+        self.assertEqual(manager.events.dispatch(self, EVENT_NAME,
+                                                 zone='b'), "hello")
+        self.assertEqual(callback_tracker, [])
+
+    def test_derived_manager_with_provider(self):
+        EVENT_NAME = "provider.compute.regions.list"
+        callback_tracker = []
+
+        class Provider(object):
+
+            def __init__(self, manager):
+                self.events = manager.events
+                manager.add(self)
+
+            @dispatch(event=EVENT_NAME, priority=2500)
+            def list_regions(self):
+                return ["region-{0}".format(id(self))]
+
+        def my_callback_intcpt(event_args, *args, **kwargs):
+            callback_tracker.append(event_args['sender'])
+            return event_args['next_handler'].invoke(event_args, *args,
+                                                     **kwargs)
+
+        base = SimpleMiddlewareManager()
+        base.events.intercept("provider.*", 2000, my_callback_intcpt)
+        base.events.observe("other.event", 2000, lambda event_args: None)
+        template = base.events.freeze()
+
+        p1 = Provider(SimpleMiddlewareManager(template.derive()))
+        p2 = Provider(SimpleMiddlewareManager(template.derive()))
+        # Each provider dispatches to its own implementer, through the
+        # shared interceptor
+        self.assertEqual(p1.list_regions(), ["region-{0}".format(id(p1))])
+        self.assertEqual(p2.list_regions(), ["region-{0}".format(id(p2))])
+        self.assertEqual(callback_tracker, [p1, p2])
+        self.assertEqual(p1.events.dispatch(p1, EVENT_NAME),
+                         ["region-{0}".format(id(p1))])
+        # Events which the providers don't subscribe to share the chains of
+        # the template
+        chain = template.get_chain_for_event("other.event")
+        self.assertIs(chain, p1.events.get_chain_for_event("other.event"))
+        self.assertIs(chain, p2.events.get_chain_for_event("other.event"))
+
+        # Templates cannot contain the handlers of dispatch decorated
+        # methods, since they are bound to a single provider
+        with self.assertRaises(HandlerException):
+            p1.events.freeze()
+
+    def test_streaming_decorator(self):
+        EVENT_NAME = "provider.compute.regions.list"
+
+        class Provider(object):
+
+            def __init__(self):
+                self.events = SimpleEventDispatcher()
+                for handler in BaseMiddleware.discover_handlers(self):
+                    self.events.subscribe(handler)
+
+            @dispatch(event=EVENT_NAME, priority=2500, stream=True)
+            def list_regions(self):
+                return iter(["a", "b"])
+
+            @intercept(event_pattern=EVENT_NAME, priority=2400)
+            def my_callback_intcpt(self, event_args, *args, **kwargs):
+                return event_args['next_handler'].invoke(
+                    event_args, *args, **kwargs).map(str.upper)
+
+        self.assertEqual(list(Provider().list_regions()), ["A", "B"])
@@ -0,0 +1,78 @@
+import fnmatch
+import unittest
+
+from pyeventsystem.patterns import PatternIndex
+from pyeventsystem.patterns import compile_patterns
+from pyeventsystem.patterns import covering_pattern
+
+
+class PatternIndexTestCase(unittest.TestCase):
+
+    PATTERNS = ["*", "event.*", "event.hello.world", "event.*.there",
+                "event.hello.*", "someevent.hello.*", "event.hel?o.world",
+                "*.world", "event.[ht]ello.*", "event", "event.hello.world.*"]
+
+    EVENTS = ["event", "event.", "event.hello", "event.hello.world",
+              "event.hello.there", "event.test.hello.world", "hello.world",
+              "someevent.hello.world", "event.tello.x", "other", ""]
+
+    def test_match_agrees_with_fnmatch(self):
+        index = PatternIndex()
+        for pattern in self.PATTERNS:
+            index.add(pattern)
+        for event in self.EVENTS:
+            self.assertSetEqual(
+                set(p for p in self.PATTERNS
+                    if fnmatch.fnmatchcase(event, p)),
+                set(index.match(event)),
+                "Index returned unexpected matches for {0}".format(event))
+
+    def test_remove_pattern(self):
+        index = PatternIndex()
+        for pattern in self.PATTERNS:
+            index.add(pattern)
+        for pattern in self.PATTERNS:
+            index.remove(pattern)
+            self.assertNotIn(pattern, index)
+            self.assertNotIn(pattern, index.match("event.hello.world"))
+        self.assertEqual(len(index), 0)
+        self.assertListEqual([], index.match("event.hello.world"))
+        # removing an unknown pattern should be a no-op
+        index.remove("event.unknown")
+
+    def test_literal_patterns(self):
+        index = PatternIndex()
+        index.add("event.hello.world")
+        index.add("event")
+        # Literal names are matched without walking the trie
+        self.assertListEqual(["event.hello.world"],
+                             index.match("event.hello.world"))
+        self.assertListEqual([], index.match("event.hello"))
+        copy = index.copy()
+        copy.add("event.*")
+        copy.remove("event")
+        self.assertSetEqual({"event.hello.world", "event.*"},
+                            set(copy.match("event.hello.world")))
+        self.assertSetEqual({"event.hello.world", "event"}, set(index))
+        self.assertSetEqual({"event.hello.world", "event.*"}, set(copy))
+
+    def test_covering_pattern(self):
+        self.assertEqual(covering_pattern(["event.*"]), "event.*")
+        self.assertEqual(covering_pattern(["*.list", "provider.*"]), "*")
+        self.assertEqual(
+            covering_pattern(["provider.compute.*.list",
+                              "provider.storage.*.list"]),
+            "provider.*.list")
+        self.assertEqual(covering_pattern(["a.list", "a.list.list"]),
+                         "a.list*")
+        self.assertEqual(covering_pattern(["a[bc]", "z[bc]"]), "*")
+        for i, first in enumerate(self.PATTERNS):
+            for second in self.PATTERNS[i:]:
+                pattern = covering_pattern([first, second])
+                match = compile_patterns([first, second])
+                for event in self.EVENTS:
+                    matched = (fnmatch.fnmatchcase(event, first) or
+                               fnmatch.fnmatchcase(event, second))
+                    self.assertEqual(match(event), matched)
+                    if matched:
+                        self.assertTrue(fnmatch.fnmatchcase(event, pattern))
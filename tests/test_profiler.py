@@ -0,0 +1,95 @@
+import json
+import unittest
+
+from pyeventsystem.events import SimpleEventDispatcher
+from pyeventsystem.profiler import DispatchProfiler
+
+
+class DispatchProfilerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.profiler = DispatchProfiler()
+        self.dispatcher = SimpleEventDispatcher(instrumentation=self.profiler)
+
+        def my_callback_obs(event_args, *args, **kwargs):
+            pass
+
+        def my_callback_impl(*args, **kwargs):
+            return self.dispatcher.dispatch(self, "inner.event", *args,
+                                            **kwargs)
+
+        def my_callback_inner(fail=False):
+            if fail:
+                raise ValueError("failed")
+            return "hello"
+
+        self.dispatcher.observe("outer.event", 1000, my_callback_obs)
+        self.dispatcher.implement("outer.event", 1001, my_callback_impl)
+        self.dispatcher.implement("inner.event", 1000, my_callback_inner)
+
+    def test_nested_spans(self):
+        self.assertEqual(self.dispatcher.dispatch(self, "outer.event"),
+                         "hello")
+        with self.assertRaises(ValueError):
+            self.dispatcher.dispatch(self, "outer.event", fail=True)
+
+        spans = self.profiler.spans()
+        self.assertEqual(len(spans), 2)
+        root = spans[0]
+        self.assertIsNone(root.handler)
+        self.assertEqual(root.name, "outer.event")
+        self.assertEqual(
+            [c.name.rsplit(".", 1)[-1] for c in root.children],
+            ["my_callback_obs", "my_callback_impl"])
+        nested = root.children[1].children[0]
+        self.assertEqual(nested.name, "inner.event")
+        self.assertEqual(nested.children[0].name.rsplit(".", 1)[-1],
+                         "my_callback_inner")
+        self.assertGreaterEqual(root.wall_time, nested.wall_time)
+        self.assertGreaterEqual(root.cpu_time, 0.0)
+        self.assertFalse(root.failed)
+        self.assertTrue(spans[1].failed)
+        self.assertTrue(spans[1].children[1].children[0].failed)
+
+        stacks = self.profiler.collapsed_stacks()
+        self.assertEqual(len(stacks), 5)
+        self.assertIn(("outer.event", root.children[1].name, "inner.event",
+                       nested.children[0].name), stacks)
+        self.assertAlmostEqual(sum(stacks.values()),
+                               root.wall_time + spans[1].wall_time)
+        for line in self.profiler.export_collapsed().splitlines():
+            stack, micros = line.rsplit(" ", 1)
+            self.assertTrue(stack.startswith("outer.event"))
+            self.assertGreater(int(micros), 0)
+
+        self.profiler.reset()
+        self.assertEqual(self.profiler.spans(), [])
+        self.assertEqual(self.profiler.export_collapsed(), "")
+
+    def test_sample_rate(self):
+        self.profiler.sample_rate = 0.0
+        for _ in range(10):
+            self.dispatcher.dispatch(self, "outer.event")
+        self.assertEqual(self.profiler.spans(), [])
+        self.profiler.sample_rate = 1.0
+        self.dispatcher.dispatch(self, "outer.event")
+        self.assertEqual(len(self.profiler.spans()), 1)
+
+        with self.assertRaises(ValueError):
+            DispatchProfiler(sample_rate=2)
+
+    def test_export_speedscope(self):
+        self.dispatcher.dispatch(self, "outer.event")
+        profile = json.loads(json.dumps(
+            self.profiler.export_speedscope(name="test")))
+        frames = [f['name'] for f in profile['shared']['frames']]
+        self.assertEqual(frames[0], "outer.event")
+        self.assertIn("inner.event", frames)
+        self.assertEqual([p['name'] for p in profile['profiles']],
+                         ["test (wall time)", "test (CPU time)"])
+        for p in profile['profiles']:
+            self.assertEqual(p['type'], 'sampled')
+            self.assertEqual(len(p['samples']), len(p['weights']))
+            self.assertAlmostEqual(p['endValue'], sum(p['weights']))
+            for sample in p['samples']:
+                self.assertEqual(sample[0], 0)